@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+CELular benchmark harness
+=========================
+
+Times collection, CEL conversion, expression compilation and per-expression evaluation against synthetic
+process, mount and user tables swapped in for psutil.process_iter, psutil.disk_partitions and pwd.getpwall.
+
+    ./benchmarks/celular_bench.py --procs=1000,10000,100000 --vars-len=60 > bench.json
+
+Results are written to stdout as JSON so runs of different versions can be compared.
+"""
+
+import collections
+import json
+import logging
+import os
+import platform
+import pwd
+import sys
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import psutil
+import celular
+
+
+########################################################################################################################
+SDiskPart = collections.namedtuple('sdiskpart', ['device', 'mountpoint', 'fstype', 'opts'])
+
+
+########################################################################################################################
+class SyntheticProcess(object):
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, pid, users):
+        self.pid = pid
+        # nothing matches the shipped configs: every expression has to scan the whole table
+        self._values = {
+            'pid': pid,
+            'ppid': max(1, pid // 10),
+            'name': f'worker{pid % 200}',
+            'exe': f'/opt/svc/bin/worker{pid % 200}',
+            'cwd': f'/var/lib/svc{pid % 50}/run',
+            'username': users[pid % len(users)].pw_name,
+            'create_time': 1700000000.0 + pid,
+            'cmdline': [f'/opt/svc/bin/worker{pid % 200}', '--serve', str(pid)],
+            'status': 'sleeping',
+            'num_threads': 1 + pid % 8,
+            'open_files': [],
+        }
+        self.info = {}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def as_dict(self, attrs=None, ad_value=None):
+        return {k: self._values.get(k, ad_value) for k in (attrs or self._values)}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def is_running(self):
+        return True
+
+
+########################################################################################################################
+class SyntheticHost(object):
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, procs, mounts, users):
+        self.users = [
+            pwd.struct_passwd((f'user{n}', 'x', 1000 + n, 1000 + n, f'User {n}', f'/home/user{n}', '/bin/bash'))
+            for n in range(users)
+        ]
+        self.mounts = [SDiskPart(f'/dev/vd{n}', f'/srv/volume{n}', 'ext4', 'rw,relatime') for n in range(mounts)]
+        self.procs = {pid: SyntheticProcess(pid, self.users) for pid in range(1, procs + 1)}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def process_iter(self, attrs=None, ad_value=None):
+        for pid in sorted(self.procs):
+            proc = self.procs[pid]
+            if attrs is not None:
+                proc.info = proc.as_dict(attrs, ad_value)
+            yield proc
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def patches(self):
+        return [
+            mock.patch.object(psutil, 'process_iter', self.process_iter),
+            mock.patch.object(psutil, 'pids', lambda: sorted(self.procs)),
+            mock.patch.object(psutil, 'Process', lambda pid: self.procs[pid]),
+            mock.patch.object(psutil, 'disk_partitions', lambda *args, **kwargs: list(self.mounts)),
+            mock.patch.object(pwd, 'getpwall', lambda: list(self.users)),
+        ]
+
+
+########################################################################################################################
+def timed(fun, *args, **kwargs):
+    start = time.perf_counter()
+    result = fun(*args, **kwargs)
+    return result, round(time.perf_counter() - start, 6)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def load_config(path, vars_len, options):
+    config = celular.Config(path, _init=False)
+    _vars = config._config.setdefault('vars', {})
+    # pad every list variable to vars_len with entries that never match
+    for k, v in _vars.items():
+        if isinstance(v, list) and vars_len:
+            _vars[k] = (list(v) + [f'/nonexistent/{k}/{n}' for n in range(vars_len)])[:max(vars_len, len(v))]
+    config._options.update(options)
+    config._parse()
+    return config
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def run(config, procs, mounts, users):
+    host = SyntheticHost(procs, mounts, users)
+    for patch in host.patches():
+        patch.start()
+    try:
+        celular.CEL_ENV_OBJECTS = config.cel_env_objects
+        expressions, compile_time = timed(
+            celular.Expressions, celular.LazyEnvironment(), config.expressions, options=config.options)
+
+        snapshot = expressions.new_snapshot()
+        uses = [u for u in expressions._uses if any(u in x['uses'] for x in expressions._expressions.values())]
+        collection, conversion = {}, {}
+        for use in uses:
+            records, collection[use] = timed(snapshot.records, use)
+            _, conversion[use] = timed(snapshot.get, use)
+
+        evaluation = []
+        iterator = expressions._iter_eval_indexed(snapshot=snapshot)
+        while True:
+            start = time.perf_counter()
+            try:
+                i, result = next(iterator)
+            except StopIteration:
+                break
+            evaluation.append({'exprno': i, 'result': bool(result), 'time': round(time.perf_counter() - start, 6)})
+    finally:
+        mock.patch.stopall()
+
+    return {
+        'procs': procs,
+        'mounts': mounts,
+        'users': users,
+        'compile': compile_time,
+        'collection': collection,
+        'conversion': conversion,
+        'evaluation': evaluation,
+        'total': round(compile_time + sum(collection.values()) + sum(conversion.values())
+                       + sum(e['time'] for e in evaluation), 6),
+    }
+
+
+########################################################################################################################
+def main(argv):
+    opt_config = celular.DEFAULT_CONFIG_PATH
+    opt_procs = [1000, 10000]
+    opt_mounts = 50
+    opt_users = 200
+    opt_vars_len = 0
+    opt_options = {}
+    usage_str = f'{os.path.basename(__file__)} [--config=/path/to/config.json] [--procs=1000,10000,100000]' \
+                f' [--mounts=N] [--users=N] [--vars-len=N] [--options={{"native_functions": false}}]'
+
+    for arg in argv[1:]:
+        _arg, _sep, _val = arg.partition('=')
+        try:
+            if _arg == '--config':
+                opt_config = os.path.abspath(_val)
+            elif _arg == '--procs':
+                opt_procs = [int(v) for v in _val.split(',') if v]
+            elif _arg == '--mounts':
+                opt_mounts = int(_val)
+            elif _arg == '--users':
+                opt_users = int(_val)
+            elif _arg == '--vars-len':
+                opt_vars_len = int(_val)
+            elif _arg == '--options':
+                opt_options = json.loads(_val)
+            else:
+                print(usage_str, file=sys.stderr)
+                return -1
+        except ValueError:
+            print(f'Invalid value: {repr(arg)}', file=sys.stderr)
+            return -1
+
+    # the benchmark must neither read nor write the on-disk caches
+    options = {'compiled_cache': False, 'expression_stats': False, 'users_cache': False}
+    options.update(opt_options)
+    # keep per-run log lines out of the timings
+    logging.disable(logging.INFO)
+
+    results = []
+    for procs in opt_procs:
+        config = load_config(opt_config, opt_vars_len, options)
+        results.append(run(config, procs, opt_mounts, opt_users))
+
+    print(json.dumps({
+        'celular': celular.__VERSION__,
+        'celpy': celular.celpy_version(),
+        'python': platform.python_version(),
+        'config': opt_config,
+        'vars_len': opt_vars_len,
+        'options': options,
+        'results': results,
+    }, indent=2))
+    return 0
+
+
+########################################################################################################################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
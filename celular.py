@@ -6,16 +6,41 @@ CELular: The CEL-powered Linux audit utility
 by circasee (https://github.com/circasee).
 """
 
+import array
+import bisect
+import concurrent.futures
+import contextlib
 import copy
+import errno
+import functools
+import hashlib
+import itertools
+import pickle
 import pwd
 import re
+import resource
+import select
+import signal
+import socket
+import socketserver
+import struct
 import sys
+import threading
+import time
 import celpy
+import lark
 import json
 import logging
+import mmap
 import os
 import psutil
 
+try:
+    import numpy
+except ImportError:
+    # the columnar engine is optional
+    numpy = None
+
 __VERSION__ = '0.3.0-beta'
 
 
@@ -33,6 +58,12 @@ basename = os.path.splitext(os.path.basename(__file__))[0]
 BASECONFIG = "{}.json".format(basename)
 DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), BASECONFIG)
 ALT_CONFIG_PATH = os.path.join('/usr/local/etc', BASECONFIG)
+DEFAULT_CACHE_DIR = os.path.join('/var/cache', basename)
+DEFAULT_SOCKET_PATH = os.path.join('/run', f'{basename}.sock')
+DEFAULT_DAEMON_INTERVAL = 5.0
+DEFAULT_USERS_TTL = 300.0
+DEFAULT_WATCH_INTERVAL = 60.0
+DEFAULT_WATCH_DEBOUNCE = 0.5
 
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 _logger = logging.getLogger()
@@ -44,6 +75,316 @@ GLOBALS = {}
 VARS = {}
 CEL_ENV_OBJECTS = {}
 
+# CEL macros that bind a per-record variable, e.g. procs.filter(proc, ...)
+CEL_MACROS = ('all', 'exists', 'exists_one', 'filter', 'map')
+# Single-child parse tree levels that only carry operator precedence
+_AST_PASSTHROUGH = ('expr', 'conditionalor', 'conditionaland', 'relation', 'addition', 'multiplication',
+                    'unary', 'member', 'primary')
+
+
+########################################################################################################################
+def _ast_unwrap(tree):
+    while isinstance(tree, lark.Tree) and tree.data in _AST_PASSTHROUGH and len(tree.children) == 1:
+        tree = tree.children[0]
+    return tree
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_ident(tree):
+    tree = _ast_unwrap(tree)
+    if isinstance(tree, lark.Tree) and tree.data == 'ident':
+        return str(tree.children[0])
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_string(tree):
+    tree = _ast_unwrap(tree)
+    if isinstance(tree, lark.Tree) and tree.data == 'literal':
+        token = tree.children[0]
+        if token.type in ('STRING_LIT', 'MLSTRING_LIT'):
+            return str(celpy.evaluation.celstr(token))
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_record_keys(tree, objnames, named=None):
+    """
+    Walk a compiled CEL AST and return {objname: set(keys)} for every record key read through a macro variable,
+    e.g. procs.filter(proc, proc['cwd'] ...) -> {'procs': {'cwd'}}. A value of None means the object is used in a
+    way the walk cannot follow (indexed, passed to a function, ...) and every default key has to be kept. The keys
+    read by name are also added to the `named` dict when given, None or not.
+    """
+    used = {}
+
+    def unknown(objname):
+        used[objname] = None
+
+    def key(objname, k):
+        if named is not None:
+            named.setdefault(objname, set()).add(k)
+        if used.get(objname, set()) is not None:
+            used.setdefault(objname, set()).add(k)
+
+    def visit(node, scope, parent=None):
+        if not isinstance(node, lark.Tree):
+            return
+
+        if node.data == 'member_dot_arg':
+            target, method, args = node.children[0], str(node.children[1]), node.children[2:]
+            exprs = args[0].children if args and isinstance(args[0], lark.Tree) else []
+            objname = _ast_ident(target)
+            if method in CEL_MACROS and len(exprs) >= 2 and _ast_ident(exprs[0]):
+                var = _ast_ident(exprs[0])
+                inner = dict(scope)
+                inner.pop(var, None)
+                if objname in objnames and objname not in scope:
+                    used.setdefault(objname, set())
+                    # chaining onto the macro result, e.g. procs.filter(...)[0], hides which keys are read
+                    if parent is not None and parent.data in ('member_dot', 'member_index', 'member_dot_arg') \
+                            and not (parent.data == 'member_dot_arg' and str(parent.children[1]) == 'size'):
+                        unknown(objname)
+                    inner[var] = objname
+                else:
+                    visit(target, scope, node)
+                for x in exprs[1:]:
+                    visit(x, inner, node)
+                return
+
+        if node.data in ('member_index', 'member_dot'):
+            var = _ast_ident(node.children[0])
+            if var in scope:
+                k = _ast_string(node.children[1]) if node.data == 'member_index' else str(node.children[1])
+                if k is None:
+                    unknown(scope[var])
+                    visit(node.children[1], scope, node)
+                else:
+                    key(scope[var], k)
+                return
+
+        if node.data == 'ident_arg' and str(node.children[0]) == 'type' and len(node.children) > 1:
+            # type(proc) == map does not read any key
+            exprs = node.children[1].children
+            if len(exprs) == 1 and _ast_ident(exprs[0]) in scope:
+                return
+
+        if node.data == 'ident':
+            name = str(node.children[0])
+            if name in scope:
+                unknown(scope[name])
+            elif name in objnames:
+                unknown(name)
+            return
+
+        # the parent of a chained member is the 'member' wrapper's parent
+        for child in node.children:
+            visit(child, scope, parent if node.data == 'member' else node)
+
+    visit(tree, {})
+    return used
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_text(source, tree):
+    return source[tree.meta.start_pos:tree.meta.end_pos]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_binary(tree, op):
+    # relation: relation_ne(lhs) rhs  ->  (lhs, rhs)
+    tree = _ast_unwrap(tree)
+    if isinstance(tree, lark.Tree) and tree.data == 'relation' and len(tree.children) == 2 \
+            and isinstance(tree.children[0], lark.Tree) and tree.children[0].data == op:
+        return tree.children[0].children[0], tree.children[1]
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_conjuncts(tree):
+    tree = _ast_unwrap(tree)
+    if isinstance(tree, lark.Tree) and tree.data == 'conditionaland' and len(tree.children) == 2:
+        return _ast_conjuncts(tree.children[0]) + _ast_conjuncts(tree.children[1])
+    if isinstance(tree, lark.Tree) and tree.data == 'paren_expr':
+        return _ast_conjuncts(tree.children[0])
+    return [tree]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_macro(tree, method):
+    # target.method(var, body)  ->  (target, var, body)
+    tree = _ast_unwrap(tree)
+    if isinstance(tree, lark.Tree) and tree.data == 'member_dot_arg' and str(tree.children[1]) == method \
+            and len(tree.children) == 3 and len(tree.children[2].children) == 2:
+        var = _ast_ident(tree.children[2].children[0])
+        if var:
+            return tree.children[0], var, tree.children[2].children[1]
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_field(tree, var):
+    # var['key'] or var.key  ->  'key'
+    tree = _ast_unwrap(tree)
+    if isinstance(tree, lark.Tree) and _ast_ident(tree.children[0]) == var:
+        if tree.data == 'member_index':
+            return _ast_string(tree.children[1])
+        if tree.data == 'member_dot':
+            return str(tree.children[1])
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_type_guard(tree, var):
+    # type(var['key']) == string  ->  ('key', 'string'); type(var) == map  ->  (None, 'map')
+    operands = _ast_binary(tree, 'relation_eq')
+    if not operands:
+        return None
+    lhs, rhs = _ast_unwrap(operands[0]), _ast_ident(operands[1])
+    if isinstance(lhs, lark.Tree) and lhs.data == 'ident_arg' and str(lhs.children[0]) == 'type' and rhs \
+            and len(lhs.children) == 2 and len(lhs.children[1].children) == 1:
+        arg = lhs.children[1].children[0]
+        if _ast_ident(arg) == var:
+            return None, rhs
+        key = _ast_field(arg, var)
+        if key:
+            return key, rhs
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_references(tree, name):
+    if isinstance(tree, lark.Tree):
+        if tree.data == 'ident' and str(tree.children[0]) == name:
+            return True
+        return any(_ast_references(c, name) for c in tree.children)
+    return False
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_paths(tree):
+    # every identifier read, macro variables included, as (name,) or (name, field) for name.field and name['field']
+    if isinstance(tree, lark.Tree):
+        if tree.data == 'ident':
+            yield (str(tree.children[0]),)
+            return
+        if tree.data in ('member_dot', 'member_index') and len(tree.children) == 2:
+            name = _ast_ident(tree.children[0])
+            field = str(tree.children[1]) if tree.data == 'member_dot' else _ast_string(tree.children[1])
+            if name is not None and field is not None:
+                yield (name, field)
+                return
+        for c in tree.children:
+            yield from _ast_paths(c)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_existential(tree):
+    """
+    Match the "does any record satisfy a predicate" idioms:
+
+        L.filter(v, S.filter(r, P)) != []    L.exists(v, S.exists(r, P))
+        S.filter(r, P) != []                 S.exists(r, P)
+
+    and return {'list': L or None, 'var': v or None, 'source': S, 'record': r, 'predicate': P, 'macro': 'filter' or
+    'exists'}.
+    """
+    macro = 'exists'
+    operands = _ast_binary(tree, 'relation_ne')
+    if operands:
+        rhs = _ast_unwrap(operands[1])
+        if not (isinstance(rhs, lark.Tree) and rhs.data == 'list_lit' and not rhs.children):
+            return None
+        tree, macro = operands[0], 'filter'
+
+    outer = _ast_macro(tree, macro)
+    if not outer:
+        return None
+    inner = _ast_macro(outer[2], macro)
+    if inner and _ast_ident(inner[0]):
+        if _ast_references(outer[0], outer[1]) or outer[1] in (inner[1], _ast_ident(inner[0])):
+            return None
+        return {'list': outer[0], 'var': outer[1], 'source': _ast_ident(inner[0]), 'record': inner[1],
+                'predicate': inner[2], 'macro': macro}
+    if _ast_ident(outer[0]):
+        return {'list': None, 'var': None, 'source': _ast_ident(outer[0]), 'record': outer[1],
+                'predicate': outer[2], 'macro': macro}
+    return None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _ast_rewrite_native(source, tree, objnames):
+    """
+    Rewrite the quadratic nested-filter idioms of the shipped configs into NativeFunctions calls, e.g.
+
+        vars.current_working_directories.filter(cwd, procs.filter(proc,
+            type(proc['cwd']) == string && proc['cwd'].startsWith(cwd))) != []
+        -> any_cwd_prefix(vars.current_working_directories)
+
+    Returns the rewritten CEL text, or None when nothing matched. Only the type-guarded forms are rewritten so the
+    native functions never change a result.
+    """
+    edits = []
+
+    def recognize(node):
+        m = _ast_existential(node)
+        if not m or m['list'] is None or m['source'] not in objnames:
+            return None
+        use, v, r = objnames[m['source']], m['var'], m['record']
+        guards, starts, equals, rest = set(), set(), set(), []
+        for c in _ast_conjuncts(m['predicate']):
+            guard = _ast_type_guard(c, r)
+            call = _ast_unwrap(c)
+            eq = _ast_binary(c, 'relation_eq')
+            if guard:
+                guards.add(guard)
+            elif isinstance(call, lark.Tree) and call.data == 'member_dot_arg' and str(call.children[1]) == 'startsWith' \
+                    and _ast_field(call.children[0], r) and len(call.children) == 3 \
+                    and len(call.children[2].children) == 1 and _ast_ident(call.children[2].children[0]) == v:
+                starts.add(_ast_field(call.children[0], r))
+            elif eq and _ast_field(eq[0], r) and _ast_ident(eq[1]) == v:
+                equals.add(_ast_field(eq[0], r))
+            elif eq and _ast_field(eq[1], r) and _ast_ident(eq[0]) == v:
+                equals.add(_ast_field(eq[1], r))
+            elif _ast_references(c, v):
+                return None
+            else:
+                rest.append(c)
+
+        items = _ast_text(source, m['list'])
+        if use == Processes.usename and starts == {'cwd'} and not equals and not rest \
+                and guards <= {('cwd', 'string'), (None, 'map')} and ('cwd', 'string') in guards:
+            return f'any_cwd_prefix({items})'
+        if use == Mounts.usename and starts == {'mountpoint'} and not equals and not rest \
+                and guards <= {('mountpoint', 'string'), (None, 'map')} and ('mountpoint', 'string') in guards:
+            return f'any_mount_prefix({items})'
+        if use == Processes.usename and equals == {'name'} and not starts \
+                and guards <= {('name', 'string'), (None, 'map')} and ('name', 'string') in guards:
+            if not rest:
+                return f'procs_with_name_in({items}) != []'
+            body = ' && '.join(f'({_ast_text(source, c)})' for c in rest)
+            # a name celpy cannot compare fails only where the rest of the predicate is not false
+            return f'procs_with_name_in({items}, procs_with_name_mismatch({items}).filter({r}, {body}))' \
+                   f'.filter({r}, {body}) != []'
+        return None
+
+    def visit(node):
+        if not isinstance(node, lark.Tree):
+            return
+        if node.data == 'relation' or node.data == 'member_dot_arg':
+            replacement = recognize(node)
+            if replacement:
+                edits.append((node.meta.start_pos, node.meta.end_pos, replacement))
+                return
+        for child in node.children:
+            visit(child)
+
+    visit(tree)
+    if not edits:
+        return None
+    for start, end, replacement in sorted(edits, reverse=True):
+        source = source[:start] + f'({replacement})' + source[end:]
+    return source
+
 
 ########################################################################################################################
 class Config(object):
@@ -64,7 +405,8 @@ class Config(object):
         
         self.logger.info(f'config={self.path}')
         with open(self.path, 'rb') as f:
-            _config = json.load(f)
+            _raw = f.read()
+        _config = json.loads(_raw)
         
         self._config = _config.get('config', {})
         self._spec = _config.get('spec')
@@ -72,6 +414,8 @@ class Config(object):
         self._branch = _config.get('branch')
         self._options = self._config.get('options', {})
         self.version = self._config.get('version')
+        self.options = self._options
+        self.digest = hashlib.sha256(_raw).hexdigest()
 
         _baseloglevel = self._loggingcfg.get('basename', basename)
         if _baseloglevel:
@@ -84,6 +428,7 @@ class Config(object):
         self.vars = {}
         self.cel_env_objects = {}
         self.expressions = {}
+        self.bindings = {}
 
         if _init:
             self._parse()
@@ -141,43 +486,313 @@ class Config(object):
         for k in _globals:
             if not ALLOWED_CHARS.search(k):
                 raise SyntaxError(f"Configuration globals must match pattern: {ALLOWED_CHARS.pattern}")
-            cel_env_objects[k] = celpy.json_to_cel(_globals.get(k))
-        cel_env_objects.update({'vars': celpy.json_to_cel(vars)})
+            cel_env_objects[k] = IndexedList.of(celpy.json_to_cel(_globals.get(k)))
+        cel_env_objects.update({'vars': IndexedList.of(celpy.json_to_cel(vars))})
 
         # Set instance variables
         self.globals = _globals
         self.vars = vars
         self.cel_env_objects = cel_env_objects
         self.expressions = _config.get('expressions', {})
+        # the names expressions can read besides the sources, as plain JSON
+        self.bindings = dict(_globals, vars=vars)
+
+
+########################################################################################################################
+class LazyEnvironment(celpy.Environment):
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, package=None, annotations=None, runner_class=None):
+        # Same setup as celpy.Environment, except the Lark grammar is only built on the first compile() so that
+        # runs served entirely from the CompiledCache never construct it.
+        sys.setrecursionlimit(2500)
+        self.logger = logging.getLogger(f'celpy.{self.__class__.__name__}')
+        self.package = package
+        self.annotations = annotations or {}
+        self.runner_class = runner_class or celpy.InterpretedRunner
+        self._cel_parser = None
+        self.annotations.update(celpy.googleapis)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @property
+    def cel_parser(self):
+        if self._cel_parser is None:
+            with PROFILE.stage('grammar'):
+                self._cel_parser = celpy.CELParser(tree_class=self.runner_class.tree_node_class)
+        return self._cel_parser
+
+
+########################################################################################################################
+class CompiledCache(object):
+    prefix = 'compiled-'
+    suffix = '.pickle'
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, config, path=None, runner_class=celpy.InterpretedRunner):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.path = path or config.options.get('cache_dir', DEFAULT_CACHE_DIR)
+        self.enabled = config.options.get('compiled_cache', True)
+
+        # One entry per config file, keyed by its content, this file's source and the library versions: any change is a
+        # cache miss and the entry is overwritten by the next cold compile
+        h = hashlib.sha256()
+        for part in (config.digest, source_digest(), celpy_version(), lark.__version__, __VERSION__,
+                     runner_class.__name__):
+            h.update(str(part).encode('utf-8'))
+            h.update(b'\0')
+        self.key = h.hexdigest()
+        _name = hashlib.sha256(os.path.abspath(config.path).encode('utf-8')).hexdigest()[:16]
+        self.filename = os.path.join(self.path, f'{self.prefix}{_name}{self.suffix}')
+        self.logger.debug(f'enabled={self.enabled} filename={self.filename}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def load(self):
+        if not self.enabled:
+            return None
+        try:
+            with open(self.filename, 'rb') as f:
+                # Only unpickle files this user wrote and nobody else can modify
+                st = os.fstat(f.fileno())
+                if st.st_uid != os.geteuid() or st.st_mode & 0o022:
+                    self.logger.warning(f'ignoring untrusted cache file={self.filename}')
+                    return None
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            self.logger.info(f'cache miss key={self.key}')
+            return None
+        except Exception as E:
+            self.logger.warning(f'cache unreadable file={self.filename} error={repr(E)}')
+            return None
+        if not isinstance(entry, dict) or entry.get('key') != self.key:
+            self.logger.info(f'cache stale key={self.key}')
+            return None
+        self.logger.info(f'cache hit key={self.key}')
+        return entry
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def save(self, asts, programs):
+        if not self.enabled:
+            return False
+        try:
+            os.makedirs(self.path, mode=0o755, exist_ok=True)
+            tmp = f'{self.filename}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                os.fchmod(f.fileno(), 0o644)
+                # asts: as written in the config; programs: after the native function rewrite, as evaluated
+                pickle.dump({'key': self.key, 'asts': asts, 'programs': programs}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.filename)
+        except OSError as E:
+            self.logger.info(f'cache not written path={self.path} error={repr(E)}')
+            return False
+
+        self.logger.info(f'cache saved key={self.key}')
+        return True
+
+
+########################################################################################################################
+def celpy_version():
+    try:
+        from importlib import metadata
+        return metadata.version('cel-python')
+    except Exception:
+        return getattr(celpy, '__version__', 'unknown')
+
+
+########################################################################################################################
+@functools.lru_cache(maxsize=None)
+def source_digest():
+    # the pickled programs reference classes and functions defined here, __VERSION__ is not bumped on every edit
+    try:
+        with open(__file__, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return 'unknown'
+
+
+########################################################################################################################
+class Profiler(object):
+    # prometheus textfile metric name suffix -> stage entry field
+    metrics = (
+        ('wall_seconds', 'wall', 'Wall clock time spent in the stage'),
+        ('cpu_seconds', 'cpu', 'Process CPU time (user + system) spent in the stage'),
+        ('peak_rss_delta_bytes', 'peak_rss_delta', 'Increase of the process peak RSS during the stage'),
+        ('records', 'records', 'Records collected, converted or scanned by the stage'),
+    )
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, enabled=False):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def reset(self):
+        with self.lock:
+            self.started = time.time()
+            self.stages = []
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _maxrss(self):
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def stage(self, name, **labels):
+        # The caller may set 'records' and any other JSON-only detail on the yielded entry. CPU time and peak RSS are
+        # process-wide, so stages running concurrently on the worker pool each see the others' share.
+        if not self.enabled:
+            yield {}
+            return
+        entry = {'stage': name, 'labels': {k: str(v) for k, v in labels.items()}, 'records': None}
+        maxrss, wall, cpu = self._maxrss(), time.perf_counter(), time.process_time()
+        try:
+            yield entry
+        finally:
+            entry['wall'] = round(time.perf_counter() - wall, 6)
+            entry['cpu'] = round(time.process_time() - cpu, 6)
+            entry['peak_rss_delta'] = self._maxrss() - maxrss
+            with self.lock:
+                self.stages.append(entry)
+            self.logger.debug(f'stage={name} labels={entry["labels"]} wall={entry["wall"]} cpu={entry["cpu"]}'
+                              f' peak_rss_delta={entry["peak_rss_delta"]} records={entry["records"]}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def report(self):
+        with self.lock:
+            stages = list(self.stages)
+        return {
+            'started': self.started,
+            'wall': round(time.time() - self.started, 6),
+            'peak_rss': self._maxrss(),
+            'stages': stages,
+        }
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def to_prometheus(self, in_use=None):
+        def escape(v):
+            return v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        # one series per stage and label set; repeated stages (e.g. a re-collected source) are summed
+        series = {}
+        with self.lock:
+            for entry in self.stages:
+                labels = dict(entry['labels'], stage=entry['stage'])
+                key = tuple(sorted(labels.items()))
+                totals = series.setdefault(key, {})
+                for _suffix, field, _help in self.metrics:
+                    if entry.get(field) is not None:
+                        totals[field] = totals.get(field, 0) + entry[field]
+
+        lines = []
+        for suffix, field, _help in self.metrics:
+            name = f'{basename}_stage_{suffix}'
+            lines.append(f'# HELP {name} {_help}')
+            lines.append(f'# TYPE {name} gauge')
+            for key, totals in series.items():
+                if field in totals:
+                    _labels = ','.join(f'{k}="{escape(v)}"' for k, v in key)
+                    lines.append(f'{name}{{{_labels}}} {totals[field]}')
+        if in_use is not None:
+            lines.append(f'# HELP {basename}_in_use Whether the last run found the system in use')
+            lines.append(f'# TYPE {basename}_in_use gauge')
+            lines.append(f'{basename}_in_use {int(bool(in_use))}')
+        lines.append(f'# HELP {basename}_last_run_timestamp_seconds Start time of the last run')
+        lines.append(f'# TYPE {basename}_last_run_timestamp_seconds gauge')
+        lines.append(f'{basename}_last_run_timestamp_seconds {self.started}')
+        return '\n'.join(lines) + '\n'
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def write_textfile(self, path, in_use=None):
+        # node_exporter's textfile collector may read at any moment: write a temp file and rename it into place
+        try:
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                os.fchmod(f.fileno(), 0o644)
+                f.write(self.to_prometheus(in_use))
+            os.replace(tmp, path)
+        except OSError as E:
+            self.logger.warning(f'metrics not written path={path} error={repr(E)}')
+            return False
+        self.logger.debug(f'metrics written path={path}')
+        return True
+
+
+# Stage timings of this process; off unless enabled by main()
+PROFILE = Profiler()
 
 
 ########################################################################################################################
 class Expressions(object):
 
     # ------------------------------------------------------------------------------------------------------------------
-    def __init__(self, environment, expressions=[], _init=True):
+    def __init__(self, environment, expressions=[], _init=True, cache=None, options=None, bindings=None):
         self.logger = logger.getChild(self.__class__.__name__)
+        self.options = options or {}
+        # config globals and vars (Config.bindings); without them results are never shared between expressions
+        self.bindings = bindings
         self._expressions = {}
         self._expression = {}
         self._USES_KEY = 'uses'
         self._EXPR_KEY = 'expr'
+        self._RAW_KEY = 'raw'
+        self._SHARE_KEY = 'share'
+        self._COLUMNAR_KEY = 'columnar'
+        self._STREAM_KEY = 'stream'
         
         self._keys = set([self._USES_KEY, self._EXPR_KEY])
+        self._record_keys = {}
+        # use -> every key read by name, kept on top of the default keys when a use's keys cannot be pruned
+        self._named_keys = {}
+        self.snapshot = None
+        self.native = NativeFunctions(self)
         self._uses = {
             Processes.usename: Processes(),
             Mounts.usename: Mounts(),
             Users.usename: Users(),
             CommonUsers.usename: CommonUsers(),
+            Connections.usename: Connections(),
+            Sessions.usename: Sessions(),
         }
+        self.workers = max(1, int(self.options.get('workers', 1)))
+        self._uses[Processes.usename].workers = self.workers
+        self._uses[Processes.usename].collector = self.options.get('collector', 'psutil')
+        # one user database for users, common_users and the procfs collector's username lookups
+        self.userdb = UserDB(self.options.get('users_cache_ttl', DEFAULT_USERS_TTL),
+                             self.options.get('cache_dir', DEFAULT_CACHE_DIR) if self.options.get('users_cache', True)
+                             else None)
+        for source in self._uses.values():
+            source.userdb = self.userdb
+        self._uses[CommonUsers.usename].uid_min = int(self.options.get('common_uid_min', CommonUsers.uid_min))
+        self._uses[CommonUsers.usename].uid_max = int(self.options.get('common_uid_max', CommonUsers.uid_max))
+        self._uses[Connections.usename].kind = self.options.get('connections_kind', 'inet')
+        self._default_keys = {u: list(self._uses[u].keys) for u in self._uses}
 
         if _init:
             if not isinstance(environment, celpy.Environment):
                 raise TypeError(f'Environemnt must be instance of celpy.Environment')
             self.environment = environment
-            self.load(expressions)
+            self.load(expressions, cache)
 
     # ------------------------------------------------------------------------------------------------------------------
-    def load(self, expressions):
+    def load(self, expressions, cache=None):
+        objnames = {self._uses[u].objname: u for u in self._uses}
+        cached = cache.load() if cache else None
+        if cached is not None and (len(cached.get('asts', {})) != len(expressions)
+                                   or len(cached.get('programs', {})) != len(expressions)):
+            cached = None
+        functions = self.native.functions()
+        rewrite = self.options.get('native_functions', True)
+        columnar = self.options.get('columnar_engine', False)
+        streaming = self.options.get('streaming', True)
+        if columnar and numpy is None:
+            self.logger.warning('columnar_engine requires numpy, evaluating with celpy')
+            columnar = False
+        asts = {}
+        programs = {}
         i = 0
         for x in expressions:
             self._expressions[i] = copy.deepcopy(self._expression)
@@ -190,270 +805,2069 @@ class Expressions(object):
             
             expr = x.get(self._EXPR_KEY)
             
-            compiled_expr = self.environment.compile(expr)
-            eval_expr = self.environment.program(compiled_expr)
+            with PROFILE.stage('compile', exprno=i) as stage:
+                stage['cached'] = cached is not None
+                if cached is not None:
+                    compiled_expr, program_expr = cached['asts'][i], cached['programs'][i]
+                else:
+                    compiled_expr = program_expr = self.environment.compile(expr)
+                    rewritten = _ast_rewrite_native(expr, compiled_expr, objnames) if rewrite else None
+                    if rewritten:
+                        self.logger.info(f'exprno={i} rewritten={repr(rewritten)}')
+                        program_expr = self.environment.compile(rewritten)
+            asts[i] = compiled_expr
+            programs[i] = program_expr
+            # InterpretedRunner only wraps the AST, so rebuilding the program from a cached AST is free
+            eval_expr = self.environment.program(program_expr, functions=functions)
             self.logger.debug(f'exprno={i} rawexpr={repr(expr)}')
             self._expressions[i][self._EXPR_KEY] = eval_expr
             self._expressions[i][self._USES_KEY] = expressions[i].get(self._USES_KEY)
+            self._expressions[i][self._RAW_KEY] = expr
+            self._expressions[i][self._SHARE_KEY] = self._share_key(program_expr, expressions[i].get(self._USES_KEY))
+            # recognized from the expression as written; the (possibly rewritten) program is the fallback
+            plan = ColumnarPlan.build(compiled_expr, objnames) if columnar else None
+            self._expressions[i][self._COLUMNAR_KEY] = plan
+            if plan is not None:
+                self.logger.info(f'exprno={i} columnar use={plan.use}')
+            # "any record of one source matches": can be decided while that source is still being collected
+            match = _ast_existential(compiled_expr) if streaming else None
+            if match and any(t is not None and _ast_references(t, match['source'])
+                             for t in (match['predicate'], match['list'])):
+                # e.g. procs.exists(p, procs.exists(q, ...)): relates records that may end up in different chunks
+                match = None
+            stream = objnames.get(match['source']) if match else None
+            self._expressions[i][self._STREAM_KEY] = stream if stream in x.get(self._USES_KEY) else None
+
+            # track which record keys each source is actually read by, from the expression as written
+            named = {}
+            for objname, keys in _ast_record_keys(compiled_expr, objnames, named).items():
+                use = objnames[objname]
+                if keys is None or self._record_keys.get(use, set()) is None:
+                    self._record_keys[use] = None
+                else:
+                    self._record_keys.setdefault(use, set()).update(keys)
+            for objname, keys in named.items():
+                self._named_keys.setdefault(objnames[objname], set()).update(keys)
 
             i += 1
 
+        if cache and cached is None:
+            cache.save(asts, programs)
+
+        self._prune_keys()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _share_key(self, tree, uses):
+        # Structurally equal expressions (same parse tree, whatever the spacing) over the same sources and the same
+        # values of the globals/vars they read have the same result on a snapshot
+        if self.bindings is None:
+            return None
+        bound = {}
+        for path in sorted(set(_ast_paths(tree))):
+            if path[0] not in self.bindings:
+                continue
+            value = self.bindings[path[0]]
+            if len(path) > 1 and isinstance(value, dict):
+                value = value.get(path[1])
+            bound['.'.join(path)] = value
+        h = hashlib.sha256(repr(tree).encode('utf-8'))
+        h.update(json.dumps([sorted(uses), bound], sort_keys=True, default=str).encode('utf-8'))
+        return h.hexdigest()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _prune_keys(self):
+        # only collect the record keys the compiled expressions read, e.g. drop psutil's open_files when unused
+        for use, keys in self._record_keys.items():
+            source = self._uses.get(use)
+            if keys is None or not source.all_keys:
+                source.keys = list(self._default_keys[use])
+                # e.g. procs.map(p, p['name']) next to procs.exists(p, p['ppid'] == 1): ppid is not a default key
+                source.keys += [k for k in source.all_keys or () if k in self._named_keys.get(use, ())
+                                and k not in source.keys]
+                if isinstance(source, Processes):
+                    source._process_iter_attrs = list(source.keys)
+                self.logger.info(f'use={repr(use)} keys={source.keys} pruned=False')
+                continue
+            source.keys = [k for k in source.all_keys if k in keys]
+            if isinstance(source, Processes):
+                # an empty attrs list makes psutil.process_iter() fetch every attribute
+                source._process_iter_attrs = list(source.keys) or ['pid']
+            self.logger.info(f'use={repr(use)} keys={source.keys} pruned=True')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def share_sources(self, others):
+        # One collection for several policies: these sources collect the union of the record keys all of them read,
+        # and the other Expressions evaluate against them
+        for other in others:
+            for use, keys in other._record_keys.items():
+                if keys is None or self._record_keys.get(use, set()) is None:
+                    self._record_keys[use] = None
+                else:
+                    self._record_keys.setdefault(use, set()).update(keys)
+            for use, keys in other._named_keys.items():
+                self._named_keys.setdefault(use, set()).update(keys)
+        self._prune_keys()
+        for other in others:
+            other._uses = self._uses
+            other.userdb = self.userdb
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _iter_eval(self, expressions=None, cel_env_objects=None, snapshot=None, stats=None, ordered=False):
+        for i, result in self._iter_eval_indexed(expressions, cel_env_objects, snapshot, stats, ordered):
+            yield result
+
     # ------------------------------------------------------------------------------------------------------------------
-    def _iter_eval(self, expressions=None, cel_env_objects=None):
+    def _iter_eval_indexed(self, expressions=None, cel_env_objects=None, snapshot=None, stats=None, ordered=False):
         expressions = expressions or self._expressions
         cel_env_objects = cel_env_objects or CEL_ENV_OBJECTS
+        # One snapshot per run: every source is collected and converted at most once and shared by all expressions
+        snapshot = snapshot or self.new_snapshot()
+        self.snapshot = snapshot
+        if not ordered and self.workers > 1:
+            # every expression runs anyway: gather all of their sources at once
+            snapshot.prefetch(set(u for x in expressions.values() for u in x.get(self._USES_KEY)), self.workers)
+
+        remaining = list(expressions)
+        while remaining:
+            i = remaining[0]
+            if ordered and stats:
+                # cheapest expected cost per hit first; sources already in the snapshot cost nothing to reuse
+                i = min(remaining, key=lambda n: stats.score(expressions.get(n), snapshot))
+            remaining.remove(i)
 
-        for i in range(len(expressions)):
             x = expressions.get(i)
-            expr = x.get(self._EXPR_KEY)
             uses = x.get(self._USES_KEY)
             self.logger.debug(f'evaluate exprno={i} uses={repr(uses)}')
 
-            objects = CEL_ENV_OBJECTS
+            objects = cel_env_objects
+            plan = x.get(self._COLUMNAR_KEY)
+            # only when stopping at the first true expression; a source already in the snapshot costs nothing to scan
+            stream = x.get(self._STREAM_KEY) if ordered else None
+            if stream is not None and (stream in snapshot._records or snapshot.lazy):
+                stream = None
             for use in uses:
-                raw_objs = []
-                self.logger.info(f'process system data for {uses}')
-                for d in self._uses.get(use, {}):
-                    raw_objs.append(d)
-                
+                if (plan is not None and use == plan.use) or use == stream:
+                    # the columnar engine reads the collected records, a streamed source is not collected yet:
+                    # only converted if celpy has to take over
+                    continue
                 # for example, processes -> exposes the following: procs = [{pid: ..., name: ...}, ...]
                 # for example, mounts -> exposes: mounts = [{device: ..., mountpoint: ...}, ...]
-                objects[self._uses.get(use).objname] = celpy.json_to_cel(raw_objs)
+                objects[self._uses.get(use).objname] = snapshot.get(use)
                 
                 self.logger.info(f'exprno={i} use={repr(use)} objectlen={len(objects)}')
 
-            result = expr.evaluate(objects)
+            start = time.perf_counter()
+            key = x.get(self._SHARE_KEY)
+            if key is not None and key in snapshot.results:
+                result = snapshot.results[key]
+                self.logger.info(f'evaluate exprno={i} shared={key[:16]}')
+            else:
+                with PROFILE.stage('evaluate', exprno=i) as stage:
+                    result = None
+                    if stream is not None:
+                        result, stage['streamed'] = self._stream(i, x, snapshot, objects)
+                        stage['engine'] = 'stream'
+                    if result is None:
+                        result, stage['engine'] = self._evaluate(x, snapshot, objects)
+                    stage['records'] = sum(len(snapshot._records.get(use, ())) for use in uses)
+                    stage['result'] = bool(result)
+                if key is not None:
+                    snapshot.results[key] = result
+            if stats:
+                stats.record(x, bool(result), time.perf_counter() - start)
             self.logger.info(f'evaluate exprno={i} result={result}') 
-            yield result
+            yield i, result
+
+        self.logger.info(f'snapshot stats={snapshot.stats()}')
 
     # ------------------------------------------------------------------------------------------------------------------
-    def evaluate_until_one(self):
-        i = 0
-        for result in self._iter_eval():
-            if result:
-                self.logger.info(f'result={(i, True)}')
-                return True
-            i += 1
-        self.logger.warning(f'result={("range(%d)" % i, False,)}')
+    def _evaluate(self, x, snapshot, objects):
+        plan = x.get(self._COLUMNAR_KEY)
+        result = plan.evaluate(snapshot, objects) if plan is not None else None
+        if result is not None:
+            return result, 'columnar'
+        for use in x.get(self._USES_KEY):
+            if (plan is not None and use == plan.use) or use == x.get(self._STREAM_KEY):
+                objects[self._uses.get(use).objname] = snapshot.get(use)
+        return x.get(self._EXPR_KEY).evaluate(objects), 'celpy'
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _stream(self, i, x, snapshot, objects):
+        # Evaluate an existential expression over growing chunks of its source as they are collected: it is true for
+        # the whole source iff it is true for one chunk, so the first hit stops the scan. Returns (result, records
+        # scanned); a result of None means no chunk matched but one raised, and the full evaluation has to raise too.
+        # Only called by evaluate_until_one(): there a match and a CEL error give the same verdict, in use, so the
+        # filter() forms stream too although celpy fails them on an error in any record, even after a match.
+        use = x.get(self._STREAM_KEY)
+        source = self._uses.get(use)
+        others = [u for u in x.get(self._USES_KEY) if u != use]
+        size = max(1, int(self.options.get('streaming_chunk', 128)))
+        records, values, failed = [], [], False
+        start = time.perf_counter()
+        scan = iter(source)
+        try:
+            while True:
+                chunk = list(itertools.islice(scan, size))
+                if not chunk:
+                    break
+                size = min(size * 2, 16384)
+                part = Snapshot(dict(self._uses, **{use: RecordedSource(source, chunk)}),
+                                schema_converter=snapshot.schema_converter)
+                part.carry(snapshot, others)
+                # NativeFunctions index the chunk, not the whole source
+                self.snapshot = part
+                try:
+                    result, engine = self._evaluate(x, part, objects)
+                except Exception as E:
+                    self.logger.debug(f'exprno={i} use={use} chunk={len(chunk)} error={repr(E)}')
+                    result, failed = None, True
+                records.extend(chunk)
+                if result:
+                    self.logger.info(f'exprno={i} use={use} hit engine={engine} streamed={len(records)}')
+                    return result, len(records)
+                if values is not None and use in part._cel:
+                    values.extend(part._cel[use])
+                else:
+                    values = None
+        finally:
+            close = getattr(scan, 'close', None)
+            if close:
+                close()
+            self.snapshot = snapshot
+
+        # a complete scan: keep it for the other expressions, with the CEL values if every chunk was converted
+        snapshot._records[use] = records
+        if values is not None:
+            list_type = getattr(source, 'list_type', None)
+            snapshot._cel[use] = celpy.celtypes.ListType(values)
+            if list_type is not None:
+                snapshot._cel[use] = list_type(snapshot._cel[use])
+        snapshot.build_time[use] = snapshot.build_time.get(use, 0.0) + (time.perf_counter() - start)
+        self.logger.info(f'exprno={i} use={use} no hit streamed={len(records)} failed={failed}')
+        return (None if failed else celpy.celtypes.BoolType(False)), len(records)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def use_recorded(self, recorded):
+        # evaluate against {use: records} from a snapshot file instead of the live sources
+        needed = set(u for x in self._expressions.values() for u in x.get(self._USES_KEY))
+        missing = sorted(needed - set(recorded))
+        if missing:
+            # an absent source would evaluate as empty, i.e. idle: refuse rather than guess
+            raise ValueError(f'snapshot has no {missing}')
+        for use in needed:
+            source = self._uses[use]
+            self._uses[use] = RecordedSource(getattr(source, 'source', source), recorded[use])
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def new_snapshot(self):
+        return Snapshot(self._uses, lazy=self.options.get('lazy_records', False),
+                        schema_converter=self.options.get('schema_converter', True))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def evaluate_until_one(self, snapshot=None, stats=None, cel_env_objects=None):
+        n = 0
+        try:
+            for i, result in self._iter_eval_indexed(cel_env_objects=cel_env_objects, snapshot=snapshot, stats=stats,
+                                                     ordered=True):
+                n += 1
+                if result:
+                    self.logger.info(f'result={(i, True)} evaluated={n}/{len(self._expressions)}')
+                    return True
+        finally:
+            if stats:
+                stats.record_collection(self.snapshot)
+        self.logger.warning(f'result={("range(%d)" % n, False,)}')
         return False
 
     # ------------------------------------------------------------------------------------------------------------------
-    def evaluate_for_each(self):
+    def evaluate_for_each(self, snapshot=None, stats=None, cel_env_objects=None):
         results = []
-        for result in self._iter_eval():
+        for result in self._iter_eval(cel_env_objects=cel_env_objects, snapshot=snapshot, stats=stats):
             results.append(bool(result))
+        if stats:
+            stats.record_collection(self.snapshot)
         self.logger.info(f'results={tuple(zip(range(len(results)), results))}')
         return results
 
 
 ########################################################################################################################
-class Mounts(object):
-    usename = "mounts"
-    all_keys = ['device', 'mountpoint', 'fstype', 'opts', 'maxfile', 'maxpath']
+class ExpressionStats(object):
+    prefix = 'stats-'
+    suffix = '.json'
+    # weight of the newest sample in the moving averages
+    alpha = 0.3
 
     # ------------------------------------------------------------------------------------------------------------------
-    def __init__(self, objname='mounts', keys=['device', 'mountpoint']):
+    def __init__(self, config, path=None):
         self.logger = logger.getChild(self.__class__.__name__)
-        self.keys = keys
-        self.objname = objname
-        self.logger.debug(f'objname={self.objname} keys={self.keys}')
+        self.path = path or config.options.get('cache_dir', DEFAULT_CACHE_DIR)
+        self.enabled = config.options.get('expression_stats', True)
+        _name = hashlib.sha256(os.path.abspath(config.path).encode('utf-8')).hexdigest()[:16]
+        self.filename = os.path.join(self.path, f'{self.prefix}{_name}{self.suffix}')
+        self.data = {'expressions': {}, 'uses': {}}
 
     # ------------------------------------------------------------------------------------------------------------------
-    def __iter__(self):
-        for _part in psutil.disk_partitions():
-            # strip out any unwanted key and make sure wanted keys exits
-            d = dict(filter(lambda kv: kv[0] in self.keys, _part._asdict().items()))
-            for k in self.keys:
-                if not k in d:
-                    d[k] = None
-            self.logger.debug(d)
-            yield d
+    def load(self):
+        if not self.enabled:
+            return self
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+            if isinstance(data.get('expressions'), dict) and isinstance(data.get('uses'), dict):
+                self.data = data
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as E:
+            self.logger.warning(f'stats unreadable file={self.filename} error={repr(E)}')
+        return self
 
     # ------------------------------------------------------------------------------------------------------------------
-    def to_cel(self, v):
-        return {self.objname, celpy.json_to_cel(v)}
+    def save(self):
+        if not self.enabled:
+            return False
+        try:
+            os.makedirs(self.path, mode=0o755, exist_ok=True)
+            tmp = f'{self.filename}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.data, f)
+            os.replace(tmp, self.filename)
+        except OSError as E:
+            self.logger.info(f'stats not written path={self.path} error={repr(E)}')
+            return False
+        return True
 
     # ------------------------------------------------------------------------------------------------------------------
-    def to_json(self, all_keys=False):
-        D = {}
-        _keys = list(self.keys)
-        keys = list(_keys)
-        if all_keys:
-            keys = list(self.all_keys)
-        self.keys = keys
+    def _key(self, x):
+        # keyed by expression text and uses so reordering or editing the config does not mix up histories
+        h = hashlib.sha256(json.dumps([x.get('raw'), x.get('uses')]).encode('utf-8'))
+        return h.hexdigest()[:16]
 
-        D = {self.usename: []}
-        for d in self:
-            D[self.usename].append(d)
-        
-        return D
+    # ------------------------------------------------------------------------------------------------------------------
+    def _ewma(self, old, new):
+        return new if old is None else (1 - self.alpha) * old + self.alpha * new
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def record(self, x, result, seconds):
+        e = self.data['expressions'].setdefault(self._key(x), {'runs': 0, 'hits': 0, 'eval_time': None})
+        e['runs'] += 1
+        e['hits'] += int(result)
+        e['eval_time'] = self._ewma(e['eval_time'], seconds)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def record_collection(self, snapshot):
+        for use, seconds in snapshot.build_time.items():
+            u = self.data['uses'].setdefault(use, {'runs': 0, 'build_time': None})
+            u['runs'] += 1
+            u['build_time'] = self._ewma(u['build_time'], seconds)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def score(self, x, snapshot):
+        e = self.data['expressions'].get(self._key(x), {})
+        cost = e.get('eval_time') or 0.0
+        for use in x.get('uses', []):
+            if use not in snapshot.build_time:
+                cost += self.data['uses'].get(use, {}).get('build_time') or 0.0
+        # Laplace-smoothed hit rate: unseen expressions start at 1/2
+        p = (e.get('hits', 0) + 1) / (e.get('runs', 0) + 2)
+        return cost / p
 
 
 ########################################################################################################################
-class Processes(object):
-    usename = "processes"
-    all_keys = ['cmdline', 'connections', 'cpu_affinity', 'cpu_num', 
-                'cpu_percent', 'cpu_times', 'create_time', 'cwd', 
-                'environ', 'exe', 'gids', 'io_counters', 'ionice', 
-                'memory_full_info', 'memory_info', 'memory_maps', 
-                'memory_percent', 'name', 'nice', 'num_ctx_switches', 
-                'num_fds', 'num_handles', 'num_threads', 'open_files', 
-                'pid', 'ppid', 'status', 'terminal', 'threads', 
-                'uids', 'username']
+class PrefixIndex(object):
 
     # ------------------------------------------------------------------------------------------------------------------
-    def __init__(self, objname="procs", keys=['pid', 'name', 'exe', 
-                                              'username', 'cwd', 
-                                              'create_time', 'open_files']):
-        self.logger = logger.getChild(self.__class__.__name__)
-        self.keys = keys
-        self._process_iter_attrs = keys
-        self.objname = objname
-        self.logger.debug(f'objname={self.objname} keys={self.keys}')
+    def __init__(self, values):
+        # sorted distinct strings: every string starting with p sorts right at bisect_left(p)
+        self.values = sorted(set(filter(lambda v: isinstance(v, str), values)))
 
     # ------------------------------------------------------------------------------------------------------------------
-    def __iter__(self):
-        for _proc in psutil.process_iter(self._process_iter_attrs):
-            # strip out any unwanted key and make sure wanted keys exits
-            d = dict(
-                filter(lambda kv: kv[0] in self.keys, _proc.as_dict().items())
-            )
-            # add any missing keys to the dict
-            for k in self.keys:
-                if not k in d:
-                    d[k] = None
-            self.logger.debug(d)
-            yield d
+    def has_prefix(self, prefix):
+        i = bisect.bisect_left(self.values, prefix)
+        return i < len(self.values) and self.values[i].startswith(prefix)
+
+
+########################################################################################################################
+class NativeFunctions(object):
 
     # ------------------------------------------------------------------------------------------------------------------
-    def to_cel(self, v):
-        return {self.objname, celpy.json_to_cel(v)}
+    def __init__(self, expressions):
+        self.expressions = expressions
 
     # ------------------------------------------------------------------------------------------------------------------
-    def to_json(self, all_keys=False):
-        D = {}
-        _keys = list(self.keys)
-        keys = list(_keys)
-        if all_keys:
-            # https://psutil.readthedocs.io/en/latest/#psutil.process_iter
-            # psutil.process_iter() will throw an exception if attr names specified
-            # are not in the process information. Setting the self.keys to an empty
-            # list causes the psutil.process_iter() method to complete but because
-            # self.keys() is used to filter the results and ensure keys exist, an
-            # empty list() thus results in no values! the result is an empty JSON
-            # set of output data. For example:
-            # {"processes": {"processes": [{}, {}, {}, ..., {}], }, "mounts": {...
-            #
-            # As such, a new field is specified as self._process_iter_attrs 
-            # in order to account for this nuance in the code and psutil.process_iter().
-            #
-            # Empty list returns all values; otherwise throws an exception, e.g.
-            #     ValueError: invalid attr names 'num_handles', 'connections'
-            self.keys = list(self.all_keys)
-            self._process_iter_attrs = []
+    def functions(self):
+        return {
+            'procs_with_name_in': self.procs_with_name_in,
+            'procs_with_name_mismatch': self.procs_with_name_mismatch,
+            'any_cwd_prefix': self.any_cwd_prefix,
+            'any_mount_prefix': self.any_mount_prefix,
+            '_in_': self.operator_in,
+        }
 
-        self.keys = keys
+    # ------------------------------------------------------------------------------------------------------------------
+    def _field_values(self, use, key):
+        for record in self.expressions.snapshot.get(use):
+            yield record.get(key) if isinstance(record, celpy.celtypes.MapType) else None
 
-        D = {self.usename: []}
-        for d in self:
-            D[self.usename].append(d)
-        
-        return D
+    # ------------------------------------------------------------------------------------------------------------------
+    def _hash_index(self, use, key):
+        index = {}
+        for n, record in enumerate(self.expressions.snapshot.get(use)):
+            value = record.get(key) if isinstance(record, celpy.celtypes.MapType) else None
+            if isinstance(value, str):
+                index.setdefault(value, []).append((n, record))
+        return index
 
+    # ------------------------------------------------------------------------------------------------------------------
+    def operator_in(self, item, container):
+        # `in` over an IndexedList (common_users, lists of strings in vars/globals) is a set lookup; anything else is
+        # celpy's linear scan, with its exact error semantics
+        if isinstance(item, str) and isinstance(container, IndexedList) and container.index is not None:
+            return celpy.celtypes.BoolType(item in container.index)
+        return celpy.evaluation.operator_in(item, container)
 
-########################################################################################################################
-class Users(object):
-    usename = "users"
-    all_keys = ['pw_name', 'pw_passwd', 'pw_uid', 'pw_gid', 
-                'pw_gecos', 'pw_dir', 'pw_shell']
+    # ------------------------------------------------------------------------------------------------------------------
+    def _memo(self, name, values, compute):
+        # calls with equal arguments, from any expression of any policy, are computed once per snapshot
+        try:
+            key = (name, tuple(values))
+            hash(key)
+        except TypeError:
+            return compute()
+        return self.expressions.snapshot.index(key, compute)
 
     # ------------------------------------------------------------------------------------------------------------------
-    def __init__(self, objname="users", keys=['pw_name', 'pw_uid', 
-                                              'pw_gid', 'pw_gecos', 
-                                              'pw_dir', 'pw_shell']):
-        self.logger = logger.getChild(self.__class__.__name__)
-        self.keys = keys
-        self.objname = objname
-        self.logger.debug(f'objname={self.objname} keys={self.keys}')
+    def procs_with_name_in(self, names, mismatched=None):
+        # mismatched: the records the rest of the predicate keeps among procs_with_name_mismatch(names); without it,
+        # every process with a string name compares against every name
+        if mismatched is None:
+            mismatched = self.procs_with_name_mismatch(names)
+        if mismatched:
+            raise TypeError(f'no such overload: name == {repr(self._name_mismatch(names))}')
+        return self._memo('procs_with_name_in', names, functools.partial(self._procs_with_name_in, names))
 
     # ------------------------------------------------------------------------------------------------------------------
-    def __iter__(self):
-        for u in self._get_users():
-            d = {}
-            for k in self.keys:
-                d[k] = u.get(k, None)
-            yield d
-            self.logger.debug(d)
+    def procs_with_name_mismatch(self, names):
+        # the processes whose string name celpy fails to compare with some item of names (an int, a list, ...)
+        if self._name_mismatch(names) is None:
+            return celpy.celtypes.ListType()
+        index = self.expressions.snapshot.index('processes.name', lambda: self._hash_index(Processes.usename, 'name'))
+        return celpy.celtypes.ListType(r for n, r in sorted(itertools.chain(*index.values()), key=lambda x: x[0]))
 
     # ------------------------------------------------------------------------------------------------------------------
-    def _get_users(self, _attrs=['pw_name', 'pw_passwd', 'pw_uid', 'pw_gid', 'pw_gecos', 'pw_dir', 'pw_shell']):
-        users = []
-        for user in filter(lambda u: u, pwd.getpwall()):
-            u = {}
-            for attr in filter(lambda a: a != 'pw_passwd', _attrs):
-                u[attr] = getattr(user, attr)
-            users.append(dict(u))
-        return users
+    @staticmethod
+    def _name_mismatch(names):
+        # string == null and string == bool are false, any other type is a no-such-overload error
+        for name in names:
+            if not isinstance(name, (str, type(None), celpy.celtypes.BoolType)):
+                return name
+        return None
 
     # ------------------------------------------------------------------------------------------------------------------
-    def to_json(self, all_keys=False):
-        D = {}
-        _keys = list(self.keys)
-        keys = list(_keys)
-        if all_keys:
-            keys = list(self.all_keys)
-        self.keys = keys
+    def _procs_with_name_in(self, names):
+        # same records, in the same order, as procs.filter(proc, type(proc['name']) == string && proc['name'] in names)
+        index = self.expressions.snapshot.index('processes.name', lambda: self._hash_index(Processes.usename, 'name'))
+        found = []
+        for name in set(filter(lambda n: isinstance(n, str), names)):
+            found.extend(index.get(name, []))
+        return celpy.celtypes.ListType(r for n, r in sorted(found, key=lambda x: x[0]))
 
-        D = {self.usename: []}
-        for d in self:
-            D[self.usename].append(d)
-        
-        self.keys = list(_keys)
+    # ------------------------------------------------------------------------------------------------------------------
+    def any_cwd_prefix(self, prefixes):
+        return self._memo('any_cwd_prefix', prefixes, functools.partial(self._any_prefix, Processes.usename, 'cwd',
+                                                                        prefixes))
 
-        return D
+    # ------------------------------------------------------------------------------------------------------------------
+    def any_mount_prefix(self, prefixes):
+        return self._memo('any_mount_prefix', prefixes, functools.partial(self._any_prefix, Mounts.usename,
+                                                                          'mountpoint', prefixes))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _any_prefix(self, use, key, prefixes):
+        index = self.expressions.snapshot.index(f'{use}.{key}', lambda: PrefixIndex(self._field_values(use, key)))
+        if index.values:
+            for p in prefixes:
+                # startsWith() with anything but a string fails in celpy, whatever the other prefixes match
+                if not isinstance(p, str):
+                    raise TypeError(f'no such overload: startsWith({repr(p)})')
+        return celpy.celtypes.BoolType(any(index.has_prefix(p) for p in prefixes))
 
 
 ########################################################################################################################
-class CommonUsers(Users):
-    usename = "common_users"
-    all_keys = []
+class Column(object):
+    # One record key of a source as NumPy arrays: a type code per record, plus the values of each type on first use
+    NONE, STRING, INT, BOOL, DOUBLE, NULL, MAP, LIST = range(8)
+    # NONE: missing key (a CEL error) or a value whose CEL counterpart is not modelled here, e.g. an int beyond int64
+    python_codes = {str: STRING, int: INT, bool: BOOL, float: DOUBLE, type(None): NULL, dict: MAP, list: LIST}
+    type_codes = {'string': STRING, 'int': INT, 'bool': BOOL, 'double': DOUBLE, 'null_type': NULL, 'map': MAP,
+                  'list': LIST, 'uint': -1, 'bytes': -1, 'type': -1}
 
     # ------------------------------------------------------------------------------------------------------------------
-    def __init__(self, objname="common_users", keys=['pw_name', 'pw_uid', 'pw_gid', 
-                                                     'pw_gecos', 'pw_dir', 'pw_shell'], *args, **kwargs):
-        self.logger = logger.getChild(self.__class__.__name__)
-        super().__init__(self, *args, **kwargs)
-        self.keys = keys
-        self.objname = objname
-        self.logger.debug(f'objname={self.objname} keys={self.keys}')
+    def __init__(self, records, key):
+        missing = object()
+        self._values = [d.get(key, missing) for d in records]
+        self.codes = numpy.fromiter(map(self._code, self._values), dtype=numpy.int8, count=len(self._values))
+        self._strings = self._ints = self._bools = None
 
     # ------------------------------------------------------------------------------------------------------------------
-    def __iter__(self):
-        for user in self._get_users():
-            yield user
+    def _code(self, v):
+        code = self.python_codes.get(type(v), self.NONE)
+        # NumPy unicode arrays drop trailing NULs
+        if code == self.STRING and '\x00' in v:
+            return self.NONE
+        if code == self.INT and not -2 ** 63 <= v < 2 ** 63:
+            return self.NONE
+        return code
 
     # ------------------------------------------------------------------------------------------------------------------
-    def _get_users(self, _uid_min=1000, _uid_max=1999, _attrs=['pw_name', 'pw_passwd', 
-                                                               'pw_uid', 'pw_gid', 'pw_gecos', 'pw_dir', 'pw_shell']):
-        users = set()
-        for user in filter(lambda u: u.get('pw_uid') >= _uid_min and u.get('pw_uid') <= _uid_max, super()._get_users()):
-            users.add(user.get('pw_name'))
-        return list(users)
+    def strings(self):
+        if self._strings is None:
+            self._strings = numpy.array([v if c == self.STRING else '' for v, c in zip(self._values, self.codes)],
+                                        dtype=str)
+        return self._strings
 
     # ------------------------------------------------------------------------------------------------------------------
-    def to_json(self, *args, **kwargs):
-        return self._get_users()
+    def ints(self):
+        if self._ints is None:
+            self._ints = numpy.array([v if c == self.INT else 0 for v, c in zip(self._values, self.codes)],
+                                     dtype=numpy.int64)
+        return self._ints
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def bools(self):
+        if self._bools is None:
+            self._bools = numpy.array([c == self.BOOL and v for v, c in zip(self._values, self.codes)], dtype=bool)
+        return self._bools
 
 
 ########################################################################################################################
-def to_json(uses=[], all_keys=False):
-    e = Expressions(environment=None, _init=False)
-    D = {}
-    if not uses:
-        uses.extend(e._uses.keys())
-    
-    for k in filter(lambda u: u in uses, e._uses):
-        obj = e._uses.get(k)
+class ColumnarPlan(object):
+    """
+    Vectorized evaluation of the existential idiom (see _ast_existential) over NumPy columns of the collected records.
+    The per-record predicate may combine type guards, ==, !=, in, startsWith, endsWith and contains against literals,
+    the outer macro variable, globals and vars with &&, || and !. Each step yields a (true, false) mask pair and a
+    record in neither is a CEL error: any error hands the expression back to celpy, so results never differ.
+    """
+    methods = {
+        'startsWith': lambda strings, s: numpy.char.startswith(strings, s),
+        'endsWith': lambda strings, s: numpy.char.endswith(strings, s),
+        'contains': lambda strings, s: numpy.char.find(strings, s) >= 0,
+    }
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, match, objname, use):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.objname = objname
+        self.use = use
+        self.var = match['var']
+        self.record = match['record']
+        self.evaluated = self.fallbacks = 0
+        self.items = self._bound(match['list']) if match['list'] is not None else (lambda ctx: [None])
+        self.predicate = self._predicate(match['predicate']) if self.items is not None else None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def build(cls, tree, objnames):
+        m = _ast_existential(tree)
+        if not m or m['source'] not in objnames:
+            return None
+        plan = cls(m, m['source'], objnames[m['source']])
+        return plan if plan.predicate is not None else None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _bound(self, node):
+        # an operand that does not depend on the record: literal, outer variable, global, vars.x or a list of those
+        node = _ast_unwrap(node)
+        if not isinstance(node, lark.Tree):
+            return None
+        if node.data == 'literal':
+            token = node.children[0]
+            if token.type in ('STRING_LIT', 'MLSTRING_LIT'):
+                value = _ast_string(node)
+            elif token.type == 'INT_LIT':
+                try:
+                    value = int(str(token), 0)
+                except ValueError:
+                    return None
+            elif token.type == 'BOOL_LIT':
+                value = str(token) == 'true'
+            elif token.type == 'NULL_LIT':
+                value = None
+            else:
+                return None
+            return lambda ctx: value
+        if node.data == 'list_lit':
+            items = [self._bound(c) for c in (node.children[0].children if node.children else [])]
+            if None in items:
+                return None
+            return lambda ctx: [f(ctx) for f in items]
+        name = _ast_ident(node)
+        if name is None and node.data in ('member_dot', 'member_index') and len(node.children) == 2:
+            name = _ast_ident(node.children[0])
+            field = str(node.children[1]) if node.data == 'member_dot' else _ast_string(node.children[1])
+            if name is None or field is None or name in (self.record, self.var, self.objname):
+                return None
+            return lambda ctx: ctx['objects'][name][field]
+        if name is None or name in (self.record, self.objname):
+            return None
+        if name == self.var:
+            return lambda ctx: ctx['item']
+        return lambda ctx: ctx['objects'][name]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _predicate(self, node):
+        fn = self._compile(node)
+        if fn is None or self.var is None or _ast_references(node, self.var):
+            return fn
+        # does not depend on the outer variable: computed once per evaluation, not once per list item
+        key = id(node)
+        return lambda ctx: ctx['memo'][key] if key in ctx['memo'] else ctx['memo'].setdefault(key, fn(ctx))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _compile(self, node):
+        node = _ast_unwrap(node)
+        if not isinstance(node, lark.Tree):
+            return None
+        if node.data == 'paren_expr':
+            return self._predicate(node.children[0])
+        if node.data in ('conditionaland', 'conditionalor') and len(node.children) == 2:
+            lhs, rhs = self._predicate(node.children[0]), self._predicate(node.children[1])
+            if lhs is None or rhs is None:
+                return None
+            # CEL && and || are commutative over errors, as in celpy: false && error is false, true || error is true
+            if node.data == 'conditionaland':
+                return lambda ctx: self._combine(lhs(ctx), rhs(ctx), numpy.logical_and, numpy.logical_or)
+            return lambda ctx: self._combine(lhs(ctx), rhs(ctx), numpy.logical_or, numpy.logical_and)
+        if node.data == 'unary' and len(node.children) == 2 and isinstance(node.children[0], lark.Tree) \
+                and node.children[0].data == 'unary_not':
+            operand = self._predicate(node.children[1])
+            if operand is None:
+                return None
+            return lambda ctx: self._not(operand(ctx))
+        if node.data == 'literal' and node.children[0].type == 'BOOL_LIT':
+            value = str(node.children[0]) == 'true'
+            return lambda ctx: (numpy.full(ctx['n'], value), numpy.full(ctx['n'], not value))
+
+        guard = _ast_type_guard(node, self.record)
+        if guard:
+            key, name = guard
+            if name not in Column.type_codes:
+                return None
+            if key is None:
+                # records are checked to be maps before evaluating
+                return lambda ctx: (numpy.full(ctx['n'], name == 'map'), numpy.full(ctx['n'], name != 'map'))
+            code = Column.type_codes[name]
+            return lambda ctx: self._type_is(ctx['column'](key), code)
+
+        for op in ('relation_eq', 'relation_ne', 'relation_in'):
+            operands = _ast_binary(node, op)
+            if not operands:
+                continue
+            key, bound = _ast_field(operands[0], self.record), self._bound(operands[1])
+            if op == 'relation_in':
+                if key is None or bound is None:
+                    return None
+                return lambda ctx: self._in(ctx['column'](key), bound(ctx))
+            if key is None or bound is None:
+                key, bound = _ast_field(operands[1], self.record), self._bound(operands[0])
+            if key is None or bound is None:
+                return None
+            if op == 'relation_eq':
+                return lambda ctx: self._eq(ctx['column'](key), bound(ctx))
+            return lambda ctx: self._not(self._eq(ctx['column'](key), bound(ctx)))
+
+        if node.data == 'member_dot_arg' and str(node.children[1]) in self.methods and len(node.children) == 3 \
+                and len(node.children[2].children) == 1:
+            key, bound = _ast_field(node.children[0], self.record), self._bound(node.children[2].children[0])
+            if key is None or bound is None:
+                return None
+            method = self.methods[str(node.children[1])]
+            return lambda ctx: self._method(ctx['column'](key), method, bound(ctx))
+        return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _combine(lhs, rhs, true_op, false_op):
+        if lhs is None or rhs is None:
+            return None
+        return true_op(lhs[0], rhs[0]), false_op(lhs[1], rhs[1])
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _not(masks):
+        return None if masks is None else (masks[1], masks[0])
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _type_is(column, code):
+        return column.codes == code, (column.codes != code) & (column.codes != Column.NONE)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _string(value):
+        return isinstance(value, str) and '\x00' not in value
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _eq(self, column, value):
+        # only the comparisons whose celpy result is known: same types, and strings against null
+        codes = column.codes
+        if isinstance(value, (bool, celpy.celtypes.BoolType)):
+            same, equal = codes == Column.BOOL, column.bools() == bool(value)
+            return same & equal, same & ~equal
+        if self._string(value):
+            same, equal = codes == Column.STRING, column.strings() == str(value)
+            return same & equal, (same & ~equal) | (codes == Column.NULL)
+        if value is None:
+            return codes == Column.NULL, codes == Column.STRING
+        if isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+            same, equal = codes == Column.INT, column.ints() == int(value)
+            return same & equal, same & ~equal
+        return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _in(self, column, values):
+        if not isinstance(values, list):
+            return None
+        if all(self._string(v) for v in values):
+            same = column.codes == Column.STRING
+            found = numpy.isin(column.strings(), [str(v) for v in values])
+            return same & found, (same & ~found) | (column.codes == Column.NULL)
+        # e.g. ports; bools are ints to Python but not to CEL
+        if values and all(isinstance(v, int) and not isinstance(v, (bool, celpy.celtypes.BoolType))
+                          and -2 ** 63 <= v < 2 ** 63 for v in values):
+            same = column.codes == Column.INT
+            found = numpy.isin(column.ints(), [int(v) for v in values])
+            return same & found, same & ~found
+        return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _method(self, column, method, value):
+        if not self._string(value):
+            return None
+        same = column.codes == Column.STRING
+        found = method(column.strings(), str(value))
+        return same & found, same & ~found
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def evaluate(self, snapshot, objects):
+        # BoolType, or None to evaluate with celpy instead
+        result = self._evaluate(snapshot, objects)
+        if result is None:
+            self.fallbacks += 1
+        else:
+            self.evaluated += 1
+        return result
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _evaluate(self, snapshot, objects):
+        if snapshot.lazy:
+            return None
+        records = snapshot.records(self.use)
+        if not snapshot.index(f'columnar:{self.use}', lambda: all(type(d) is dict for d in records)):
+            return None
+        ctx = {
+            'n': len(records),
+            'objects': objects,
+            'item': None,
+            'memo': {},
+            'column': lambda key: snapshot.index(f'columnar:{self.use}.{key}', lambda: Column(records, key)),
+        }
+        try:
+            items = self.items(ctx)
+            if not isinstance(items, list):
+                return None
+            found = False
+            # every item, as celpy does: an error after the first hit still has to surface
+            for item in items:
+                ctx['item'] = item
+                masks = self.predicate(ctx)
+                if masks is None or not (masks[0] | masks[1]).all():
+                    return None
+                found = found or bool(masks[0].any())
+        except (KeyError, IndexError, TypeError) as E:
+            self.logger.debug(f'objname={self.objname} unbound={repr(E)}')
+            return None
+        return celpy.celtypes.BoolType(found)
+
+
+########################################################################################################################
+class _CELTypeMeta(type):
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __eq__(cls, other):
+        # CEL's type(proc) == map compares classes; a LazyRecord (IndexedList) has to pass as a plain map (list)
+        return other is cls.cel_type or type.__eq__(cls, other) is True
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __ne__(cls, other):
+        return not _CELTypeMeta.__eq__(cls, other)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __hash__(cls):
+        return type.__hash__(cls)
+
+
+########################################################################################################################
+class LazyRecord(celpy.celtypes.MapType, metaclass=_CELTypeMeta):
+    cel_type = celpy.celtypes.MapType
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, keys, resolve):
+        super().__init__()
+        self._keys = keys
+        self._resolve = resolve
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __getitem__(self, key):
+        if not celpy.celtypes.MapType.valid_key_type(key):
+            raise TypeError(f'unsupported key type: {type(key)}')
+        if not dict.__contains__(self, key):
+            if key not in self._keys:
+                raise KeyError(key)
+            # memoized for the rest of the run
+            dict.__setitem__(self, key, celpy.json_to_cel(self._resolve(str(key))))
+        return dict.__getitem__(self, key)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _resolve_all(self):
+        for k in self._keys:
+            self[celpy.celtypes.StringType(k)]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def get(self, key, default=None):
+        return self[key] if key in self._keys else default
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(celpy.celtypes.StringType(k) for k in self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def keys(self):
+        self._resolve_all()
+        return dict.keys(self)
+
+    def items(self):
+        self._resolve_all()
+        return dict.items(self)
+
+    def values(self):
+        self._resolve_all()
+        return dict.values(self)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self._keys}, resolved={list(dict.keys(self))})'
+
+
+########################################################################################################################
+class IndexedList(celpy.celtypes.ListType, metaclass=_CELTypeMeta):
+    # A CEL list of strings that also answers `x in list` from a set, see NativeFunctions.operator_in
+    cel_type = celpy.celtypes.ListType
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, values=()):
+        super().__init__(values)
+        # with any non-string member CEL's `in` can raise a no-such-overload error, which only the scan reproduces
+        self.index = frozenset(self) if all(isinstance(v, str) for v in self) else None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def of(cls, value):
+        # the same CEL value with every list of strings in it indexed
+        if type(value) is celpy.celtypes.MapType:
+            return celpy.celtypes.MapType({k: cls.of(v) for k, v in value.items()})
+        if type(value) is celpy.celtypes.ListType:
+            values = [cls.of(v) for v in value]
+            return cls(values) if all(isinstance(v, str) for v in values) else celpy.celtypes.ListType(values)
+        return value
+
+
+########################################################################################################################
+class RecordConverter(object):
+    # exact Python type -> CEL value for the scalar fields the collectors produce; anything else goes to json_to_cel.
+    # The type is already known, so this skips the celtypes constructors' conversion checks (IntType builds its int64
+    # range-check wrapper on every call).
+    scalars = {
+        str: functools.partial(str.__new__, celpy.celtypes.StringType),
+        float: functools.partial(float.__new__, celpy.celtypes.DoubleType),
+        bool: celpy.celtypes.BoolType,
+    }
+    int64 = (-2 ** 63, 2 ** 63)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, identity=None):
+        self.logger = logger.getChild(self.__class__.__name__)
+        # record fields naming the same entry across collections, e.g. pid + create_time for a process
+        self.identity = tuple(identity or ())
+        # field name -> StringType key, shared by every converted map
+        self._keys = {}
+        # identity -> (record as converted, MapType); only the entries of the previous convert() are kept
+        self._cache = {}
+        self.reused = 0
+        self.converted = 0
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def value(self, v):
+        if v is None:
+            return None
+        if type(v) is int and self.int64[0] <= v < self.int64[1]:
+            return int.__new__(celpy.celtypes.IntType, v)
+        cel_type = self.scalars.get(type(v))
+        if cel_type is not None:
+            return cel_type(v)
+        return celpy.json_to_cel(v)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def record(self, d):
+        keys = self._keys
+        items = {}
+        for k, v in d.items():
+            key = keys.get(k)
+            if key is None:
+                key = keys[k] = celpy.celtypes.StringType(k)
+            items[key] = self.value(v)
+        # same value json_to_cel builds, without MapType.__init__'s per-item re-insert
+        m = celpy.celtypes.MapType()
+        dict.update(m, items)
+        return m
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _identity(self, d):
+        if self.identity and all(k in d for k in self.identity):
+            return tuple(d[k] for k in self.identity)
+        # identity fields pruned from the records: identical records can share one map
+        ident = tuple(d.items())
+        try:
+            hash(ident)
+        except TypeError:
+            return None
+        return ident
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def convert(self, records):
+        # Equivalent to json_to_cel(records) for the flat records of Processes, Mounts and Users. A record equal to
+        # the one converted under the same identity in the previous call reuses that MapType, which makes repeated
+        # conversion of a mostly unchanged table (daemon passes) proportional to what changed.
+        values = []
+        cache = {}
+        reused = 0
+        for d in records:
+            if not isinstance(d, dict):
+                values.append(self.value(d))
+                continue
+            ident = self._identity(d)
+            entry = self._cache.get(ident) if ident is not None else None
+            if entry is not None and entry[0] == d:
+                m = entry[1]
+                reused += 1
+            else:
+                m = self.record(d)
+            if ident is not None:
+                # a copy: ProcessTable updates its records in place
+                cache[ident] = (dict(d), m)
+            values.append(m)
+        self._cache = cache
+        self.reused += reused
+        self.converted += len(values) - reused
+        self.logger.debug(f'records={len(values)} reused={reused} cached={len(cache)}')
+        return celpy.celtypes.ListType(values)
+
+
+########################################################################################################################
+class Snapshot(object):
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, sources, lazy=False, schema_converter=True):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.sources = sources
+        self.lazy = lazy
+        self.schema_converter = schema_converter
+        self.created = time.time()
+        self._records = {}
+        self._cel = {}
+        self.build_time = {}
+        self.hits = {}
+        self.misses = {}
+        # use -> {key: number of field reads} for LazyRecord sources
+        self.fetches = {}
+        # name -> index built by NativeFunctions over this snapshot's records
+        self._indexes = {}
+        # Expressions share key -> result, for structurally equal expressions of one or more policies
+        self.results = {}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def records(self, use):
+        if use not in self._records:
+            self.logger.info(f'process system data for {repr(use)}')
+            start = time.perf_counter()
+            with PROFILE.stage('collect', use=use) as stage:
+                self._records[use] = list(self.sources.get(use, {}))
+                stage['records'] = len(self._records[use])
+            self.build_time[use] = self.build_time.get(use, 0.0) + (time.perf_counter() - start)
+        return self._records[use]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def get(self, use):
+        if use in self._cel:
+            self.hits[use] = self.hits.get(use, 0) + 1
+            return self._cel[use]
+
+        self.misses[use] = self.misses.get(use, 0) + 1
+        source = self.sources.get(use)
+        if self.lazy and getattr(source, 'lazy_records', None):
+            # fields are only read from the system when an expression first touches them
+            start = time.perf_counter()
+            with PROFILE.stage('convert', use=use) as stage:
+                self._records[use] = list(source.lazy_records(self.fetches.setdefault(use, {})))
+                self._cel[use] = celpy.celtypes.ListType(self._records[use])
+                stage['records'] = len(self._records[use])
+            self.build_time[use] = self.build_time.get(use, 0.0) + (time.perf_counter() - start)
+            return self._cel[use]
+
+        records = self.records(use)
+        start = time.perf_counter()
+        converter = getattr(source, 'converter', None) if self.schema_converter else None
+        with PROFILE.stage('convert', use=use) as stage:
+            if converter is not None:
+                self._cel[use] = converter.convert(records)
+            else:
+                self._cel[use] = celpy.json_to_cel(records)
+            list_type = getattr(source, 'list_type', None)
+            if list_type is not None:
+                self._cel[use] = list_type(self._cel[use])
+            stage['records'] = len(records)
+        self.build_time[use] = self.build_time.get(use, 0.0) + (time.perf_counter() - start)
+        self.logger.debug(f'use={repr(use)} records={len(records)} build_time={self.build_time[use]:.6f}')
+        return self._cel[use]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def carry(self, previous, uses):
+        # reuse the collected and converted records of another snapshot, e.g. for sources that did not change since
+        for use in uses:
+            if use in previous._cel:
+                self._records[use] = previous._records[use]
+                self._cel[use] = previous._cel[use]
+                self.hits[use] = self.hits.get(use, 0) + 1
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def prefetch(self, uses, workers):
+        uses = [u for u in self.sources if u in uses and u not in self._cel]
+        if len(uses) < 2:
+            return
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(uses)),
+                                                   thread_name_prefix=f'{basename}-sources') as pool:
+            # list() re-raises the first collection error, as a serial run would
+            list(pool.map(self.get, uses))
+        self.logger.info(f'prefetch uses={uses} workers={workers} time={time.perf_counter() - start:.6f}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def index(self, name, build):
+        if name not in self._indexes:
+            start = time.perf_counter()
+            self._indexes[name] = build()
+            self.logger.debug(f'index={name} build_time={time.perf_counter() - start:.6f}')
+        return self._indexes[name]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def stats(self):
+        return {
+            use: {
+                'records': len(self._records.get(use, [])),
+                'build_time': round(self.build_time.get(use, 0.0), 6),
+                'misses': self.misses.get(use, 0),
+                'hits': self.hits.get(use, 0),
+                'fetches': dict(self.fetches.get(use, {})),
+            } for use in self._records
+        }
+
+
+########################################################################################################################
+class Mounts(object):
+    usename = "mounts"
+    all_keys = ['device', 'mountpoint', 'fstype', 'opts', 'maxfile', 'maxpath']
+    identity = ('device', 'mountpoint')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, objname='mounts', keys=['device', 'mountpoint']):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.keys = keys
+        self.objname = objname
+        self.converter = RecordConverter(self.identity)
+        self.logger.debug(f'objname={self.objname} keys={self.keys}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __iter__(self):
+        for _part in psutil.disk_partitions():
+            # strip out any unwanted key and make sure wanted keys exits
+            d = dict(filter(lambda kv: kv[0] in self.keys, _part._asdict().items()))
+            for k in self.keys:
+                if not k in d:
+                    d[k] = None
+            self.logger.debug(d)
+            yield d
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def lazy_records(self, fetches):
+        for _part in psutil.disk_partitions():
+            yield LazyRecord(self.keys, functools.partial(self._fetch, _part, fetches))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _fetch(self, _part, fetches, key):
+        fetches[key] = fetches.get(key, 0) + 1
+        return getattr(_part, key, None)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def to_cel(self, v):
+        return {self.objname, celpy.json_to_cel(v)}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def to_json(self, all_keys=False):
+        D = {}
+        _keys = list(self.keys)
+        keys = list(_keys)
+        if all_keys:
+            keys = list(self.all_keys)
+        self.keys = keys
+
+        D = {self.usename: []}
+        for d in self:
+            D[self.usename].append(d)
+        
+        return D
+
+
+########################################################################################################################
+class Processes(object):
+    usename = "processes"
+    all_keys = ['cmdline', 'connections', 'cpu_affinity', 'cpu_num', 
+                'cpu_percent', 'cpu_times', 'create_time', 'cwd', 
+                'environ', 'exe', 'gids', 'io_counters', 'ionice', 
+                'memory_full_info', 'memory_info', 'memory_maps', 
+                'memory_percent', 'name', 'nice', 'num_ctx_switches', 
+                'num_fds', 'num_handles', 'num_threads', 'open_files', 
+                'pid', 'ppid', 'status', 'terminal', 'threads', 
+                'uids', 'username']
+    # a reused PID has a different create_time
+    identity = ('pid', 'create_time')
+    # PIDs per worker pool task
+    chunk_max = 64
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, objname="procs", keys=['pid', 'name', 'exe', 
+                                              'username', 'cwd', 
+                                              'create_time', 'open_files']):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.keys = keys
+        self._process_iter_attrs = keys
+        self.objname = objname
+        self.converter = RecordConverter(self.identity)
+        self.workers = 1
+        self.collector = 'psutil'
+        self.userdb = None
+        self._procfs = None
+        self.logger.debug(f'objname={self.objname} keys={self.keys}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __iter__(self):
+        self._procfs = None
+        if self.collector == 'procfs':
+            if ProcFSCollector.available() and self._process_iter_attrs:
+                self._procfs = ProcFSCollector(self._process_iter_attrs, self.userdb)
+            else:
+                self.logger.warning('collector=procfs unavailable, using psutil')
+
+        if self.workers > 1:
+            infos = self._parallel_infos()
+        elif self._procfs:
+            infos = self._procfs.infos(self._procfs.pids())
+        else:
+            # process_iter() already fetched the requested attrs into .info; as_dict() would fetch every attr again
+            infos = (_proc.info for _proc in psutil.process_iter(self._process_iter_attrs))
+        try:
+            for info in infos:
+                # strip out any unwanted key and make sure wanted keys exits
+                d = self._record(info)
+                self.logger.debug(d)
+                yield d
+        finally:
+            close = getattr(infos, 'close', None)
+            if close:
+                close()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _parallel_infos(self):
+        # Same result as process_iter(attrs): PID order, vanished PIDs skipped, access-denied attrs as None.
+        # Most of the time is spent blocked on /proc reads, so threads overlap well despite the GIL.
+        pids = self._procfs.pids() if self._procfs else sorted(psutil.pids())
+        size = max(1, min(self.chunk_max, -(-len(pids) // (self.workers * 4))))
+        chunks = (pids[n:n + size] for n in range(0, len(pids), size))
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'{basename}-procs')
+        # a bounded window of chunks in flight, so a consumer that stops early (streaming) leaves the rest unread
+        pending = [pool.submit(self._fetch_infos, chunk) for chunk in itertools.islice(chunks, self.workers * 2)]
+        try:
+            while pending:
+                infos = pending.pop(0).result()
+                pending.extend(pool.submit(self._fetch_infos, chunk) for chunk in itertools.islice(chunks, 1))
+                yield from infos
+        finally:
+            # chunks already running finish in the background, queued ones are dropped
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _fetch_infos(self, pids):
+        if self._procfs:
+            return list(self._procfs.infos(pids))
+        infos = []
+        for pid in pids:
+            try:
+                infos.append(psutil.Process(pid).as_dict(attrs=self._process_iter_attrs, ad_value=None))
+            except psutil.NoSuchProcess:
+                continue
+        return infos
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def lazy_records(self, fetches):
+        # no attrs: process_iter() only builds the Process objects, every field is read on first access
+        for _proc in psutil.process_iter():
+            yield LazyRecord(self.keys, functools.partial(self._fetch, _proc, fetches))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _fetch(self, _proc, fetches, key):
+        fetches[key] = fetches.get(key, 0) + 1
+        if key == 'pid':
+            return _proc.pid
+        try:
+            return _proc.as_dict([key], ad_value=None).get(key)
+        except psutil.NoSuchProcess:
+            # exited after the scan started; the field reads as null like an access-denied one
+            return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _record(self, info):
+        d = dict(
+            filter(lambda kv: kv[0] in self.keys, info.items())
+        )
+        # add any missing keys to the dict
+        for k in self.keys:
+            if not k in d:
+                d[k] = None
+        return d
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def to_cel(self, v):
+        return {self.objname, celpy.json_to_cel(v)}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def to_json(self, all_keys=False):
+        D = {}
+        _keys = list(self.keys)
+        keys = list(_keys)
+        if all_keys:
+            # https://psutil.readthedocs.io/en/latest/#psutil.process_iter
+            # psutil.process_iter() will throw an exception if attr names specified
+            # are not in the process information. Setting the self.keys to an empty
+            # list causes the psutil.process_iter() method to complete but because
+            # self.keys() is used to filter the results and ensure keys exist, an
+            # empty list() thus results in no values! the result is an empty JSON
+            # set of output data. For example:
+            # {"processes": {"processes": [{}, {}, {}, ..., {}], }, "mounts": {...
+            #
+            # As such, a new field is specified as self._process_iter_attrs 
+            # in order to account for this nuance in the code and psutil.process_iter().
+            #
+            # Empty list returns all values; otherwise throws an exception, e.g.
+            #     ValueError: invalid attr names 'num_handles', 'connections'
+            self.keys = list(self.all_keys)
+            self._process_iter_attrs = []
+
+        self.keys = keys
+
+        D = {self.usename: []}
+        for d in self:
+            D[self.usename].append(d)
+        
+        return D
+
+
+########################################################################################################################
+class ProcFSCollector(object):
+    # Fields read straight from /proc; anything else is fetched through psutil for that process
+    fields = ('pid', 'name', 'exe', 'cwd', 'username', 'create_time', 'ppid')
+    procfs = '/proc'
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, attrs, userdb=None):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.attrs = list(attrs)
+        self.userdb = userdb or UserDB()
+        self.fallback = [a for a in self.attrs if a not in self.fields]
+        self._clock_ticks = os.sysconf('SC_CLK_TCK')
+        self._boot_time = psutil.boot_time()
+        self._users = None
+        self._encoding = sys.getfilesystemencoding()
+        self._errors = sys.getfilesystemencodeerrors()
+        self.logger.debug(f'attrs={self.attrs} fallback={self.fallback}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def available(cls):
+        return sys.platform.startswith('linux') and os.path.isfile(os.path.join(cls.procfs, 'stat'))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def pids(self):
+        with os.scandir(self.procfs) as it:
+            return sorted(int(e.name) for e in it if e.name.isdigit())
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def infos(self, pids):
+        for pid in pids:
+            try:
+                yield self.info(pid)
+            except psutil.NoSuchProcess:
+                # vanished mid-scan: skipped, as process_iter() does
+                continue
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def info(self, pid):
+        # Mirrors psutil's Linux implementation for each field: access-denied reads as None, a vanished PID raises
+        path = f'{self.procfs}/{pid}'
+        try:
+            with open(f'{path}/stat', 'rb') as f:
+                stat = f.read()
+        except (FileNotFoundError, ProcessLookupError):
+            raise psutil.NoSuchProcess(pid)
+        rpar = stat.rfind(b')')
+        fields = stat[rpar + 2:].split()
+        zombie = fields[0] == b'Z'
+
+        d = {}
+        for attr in self.attrs:
+            if attr == 'pid':
+                d[attr] = pid
+            elif attr == 'ppid':
+                d[attr] = int(fields[1])
+            elif attr == 'create_time':
+                d[attr] = float(fields[19]) / self._clock_ticks + self._boot_time
+            elif attr == 'name':
+                d[attr] = self._name(path, stat[stat.find(b'(') + 1:rpar].decode(self._encoding, self._errors))
+            elif attr in ('exe', 'cwd'):
+                d[attr] = self._readlink(pid, f'{path}/{attr}', zombie)
+            elif attr == 'username':
+                d[attr] = self._username(pid, path)
+
+        if self.fallback:
+            d.update(psutil.Process(pid).as_dict(self.fallback, ad_value=None))
+        return d
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _name(self, path, name):
+        # the kernel truncates comm to 15 chars; psutil extends it from argv[0] when that one starts with it
+        if len(name) < 15:
+            return name
+        try:
+            with open(f'{path}/cmdline', 'r', encoding=self._encoding, errors=self._errors) as f:
+                data = f.read()
+        except (PermissionError, FileNotFoundError, ProcessLookupError):
+            return name
+        if not data:
+            return name
+        sep = '\x00' if data.endswith('\x00') else ' '
+        if data.endswith(sep):
+            data = data[:-1]
+        cmdline = data.split(sep)
+        if sep == '\x00' and len(cmdline) == 1 and ' ' in data:
+            cmdline = data.split(' ')
+        extended = os.path.basename(cmdline[0])
+        return extended if extended.startswith(name) else name
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _readlink(self, pid, path, zombie):
+        try:
+            target = os.readlink(path).split('\x00')[0]
+        except PermissionError:
+            return None
+        except (FileNotFoundError, ProcessLookupError):
+            if not os.path.lexists(f'{self.procfs}/{pid}'):
+                raise psutil.NoSuchProcess(pid)
+            # kernel threads have no exe/cwd link: psutil reports '', zombies read as access-denied
+            return None if zombie else ''
+        if target.endswith(' (deleted)') and not os.path.exists(target):
+            target = target[:-10]
+        return target
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _username(self, pid, path):
+        try:
+            with open(f'{path}/status', 'rb') as f:
+                for line in f:
+                    if line.startswith(b'Uid:'):
+                        uid = int(line.split()[1])
+                        break
+                else:
+                    return None
+        except PermissionError:
+            return None
+        except (FileNotFoundError, ProcessLookupError):
+            raise psutil.NoSuchProcess(pid)
+
+        # the user database is checked for changes once per scan
+        if self._users is None:
+            self._users = self.userdb.records()
+        name = self.userdb.name(uid)
+        # psutil reports a uid without a passwd entry as the number
+        return str(uid) if name is None else name
+
+
+########################################################################################################################
+class ProcessTable(Processes):
+    # Attributes that change over a process lifetime (chdir, exec) and are re-read for already-known PIDs
+    refresh_keys = ['cwd', 'name']
+    # the table is already a cache of fetched attributes
+    lazy_records = None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, objname="procs", keys=None, refresh_keys=None):
+        if keys is None:
+            super().__init__(objname)
+        else:
+            super().__init__(objname, list(keys))
+        if refresh_keys is not None:
+            self.refresh_keys = list(refresh_keys)
+        # pid -> (psutil.Process, record); psutil.Process identity is (pid, create_time), so a reused PID is a new entry
+        self._table = {}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def refresh(self):
+        refresh_keys = [k for k in self.refresh_keys if k in self.keys]
+        new = gone = 0
+        pids = psutil.pids()
+        for pid in pids:
+            entry = self._table.get(pid)
+            if entry is not None:
+                _proc, d = entry
+                try:
+                    if not _proc.is_running():
+                        raise psutil.NoSuchProcess(pid)
+                    if refresh_keys:
+                        d.update(_proc.as_dict(refresh_keys, ad_value=None))
+                    continue
+                except psutil.NoSuchProcess:
+                    del self._table[pid]
+                    gone += 1
+
+            # new (pid, create_time): fetch every wanted attribute once
+            try:
+                _proc = psutil.Process(pid)
+                d = self._record(_proc.as_dict(self._process_iter_attrs, ad_value=None))
+            except psutil.NoSuchProcess:
+                continue
+            self._table[pid] = (_proc, d)
+            new += 1
+
+        alive = set(pids)
+        for pid in [p for p in self._table if p not in alive]:
+            del self._table[pid]
+            gone += 1
+
+        self.logger.debug(f'table={len(self._table)} new={new} gone={gone} refresh_keys={refresh_keys}')
+        return new, gone
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __iter__(self):
+        for pid in sorted(self._table):
+            yield self._table[pid][1]
+
+
+########################################################################################################################
+class UserDB(object):
+    # One pwd.getpwall() per /etc/passwd change or ttl seconds (directory-backed users, e.g. LDAP/SSSD, do not touch
+    # /etc/passwd), optionally kept on disk so one-shot runs share it. pw_passwd is never kept.
+    passwd = '/etc/passwd'
+    filename = 'users.json'
+    fields = ('pw_name', 'pw_uid', 'pw_gid', 'pw_gecos', 'pw_dir', 'pw_shell')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, ttl=DEFAULT_USERS_TTL, path=None):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.ttl = float(ttl)
+        # cache directory for the on-disk copy; None keeps it in memory only
+        self.path = path
+        self.lock = threading.Lock()
+        self.users = None
+        self.loaded = None
+        self.mtime = None
+        # uid -> pw_name (first entry wins, as getpwuid() does), pw_name -> record
+        self.by_uid = {}
+        self.by_name = {}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _passwd_mtime(self):
+        try:
+            return os.stat(self.passwd).st_mtime
+        except OSError:
+            return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _fresh(self, entry):
+        return entry.get('mtime') == self._passwd_mtime() and 0 <= time.time() - entry.get('loaded', 0) < self.ttl
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def records(self):
+        with self.lock:
+            if self.users is None or not self._fresh({'mtime': self.mtime, 'loaded': self.loaded}):
+                self._load()
+            return self.users
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _load(self):
+        entry = self._read() if self.path else None
+        if entry is None:
+            # stat first: an edit during getpwall() leaves the entry stale rather than wrongly fresh
+            mtime = self._passwd_mtime()
+            start = time.perf_counter()
+            users = [{f: getattr(u, f) for f in self.fields} for u in pwd.getpwall() if u]
+            self.logger.info(f'getpwall users={len(users)} time={time.perf_counter() - start:.6f}')
+            entry = {'mtime': mtime, 'loaded': time.time(), 'users': users}
+            if self.path:
+                self._write(entry)
+        self.users, self.loaded, self.mtime = entry['users'], entry['loaded'], entry['mtime']
+        self.by_uid = {}
+        self.by_name = {}
+        for user in self.users:
+            self.by_uid.setdefault(user['pw_uid'], user['pw_name'])
+            self.by_name.setdefault(user['pw_name'], user)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _read(self):
+        filename = os.path.join(self.path, self.filename)
+        try:
+            with open(filename, 'r') as f:
+                # decides who counts as a common user: only trust files this user wrote and nobody else can modify
+                st = os.fstat(f.fileno())
+                if st.st_uid != os.geteuid() or st.st_mode & 0o022:
+                    self.logger.warning(f'ignoring untrusted cache file={filename}')
+                    return None
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as E:
+            self.logger.warning(f'cache unreadable file={filename} error={repr(E)}')
+            return None
+        if not isinstance(entry, dict) or not isinstance(entry.get('users'), list) or not self._fresh(entry):
+            self.logger.info(f'cache stale file={filename}')
+            return None
+        return entry
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _write(self, entry):
+        filename = os.path.join(self.path, self.filename)
+        try:
+            os.makedirs(self.path, mode=0o755, exist_ok=True)
+            tmp = f'{filename}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                os.fchmod(f.fileno(), 0o644)
+                json.dump(entry, f)
+            os.replace(tmp, filename)
+        except OSError as E:
+            self.logger.info(f'cache not written path={self.path} error={repr(E)}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def name(self, uid):
+        # pw_name for uid, or None; getpwuid() covers users getpwall() does not enumerate
+        if self.users is None:
+            self.records()
+        if uid not in self.by_uid:
+            try:
+                self.by_uid[uid] = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                self.by_uid[uid] = None
+        return self.by_uid[uid]
+
+
+########################################################################################################################
+class Users(object):
+    usename = "users"
+    all_keys = ['pw_name', 'pw_passwd', 'pw_uid', 'pw_gid', 
+                'pw_gecos', 'pw_dir', 'pw_shell']
+    identity = ('pw_uid',)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, objname="users", keys=['pw_name', 'pw_uid', 
+                                              'pw_gid', 'pw_gecos', 
+                                              'pw_dir', 'pw_shell']):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.keys = keys
+        self.objname = objname
+        self.converter = RecordConverter(self.identity)
+        self.userdb = UserDB()
+        self.logger.debug(f'objname={self.objname} keys={self.keys}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __iter__(self):
+        for u in self._get_users():
+            d = {}
+            for k in self.keys:
+                d[k] = u.get(k, None)
+            yield d
+            self.logger.debug(d)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def lazy_records(self, fetches):
+        for user in self.userdb.records():
+            yield LazyRecord(self.keys, functools.partial(self._fetch, user, fetches))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _fetch(self, user, fetches, key):
+        fetches[key] = fetches.get(key, 0) + 1
+        # pw_passwd is never exposed, see _get_users()
+        return user.get(key)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _get_users(self, _attrs=['pw_name', 'pw_passwd', 'pw_uid', 'pw_gid', 'pw_gecos', 'pw_dir', 'pw_shell']):
+        users = []
+        # the UserDB never keeps pw_passwd
+        for user in self.userdb.records():
+            u = {}
+            for attr in filter(lambda a: a != 'pw_passwd', _attrs):
+                u[attr] = user.get(attr)
+            users.append(dict(u))
+        return users
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def to_json(self, all_keys=False):
+        D = {}
+        _keys = list(self.keys)
+        keys = list(_keys)
+        if all_keys:
+            keys = list(self.all_keys)
+        self.keys = keys
+
+        D = {self.usename: []}
+        for d in self:
+            D[self.usename].append(d)
+        
+        self.keys = list(_keys)
+
+        return D
+
+
+########################################################################################################################
+class CommonUsers(Users):
+    usename = "common_users"
+    all_keys = []
+    # a plain list of user names, nothing to resolve lazily
+    lazy_records = None
+    # `proc['username'] in common_users` is a set lookup
+    list_type = IndexedList
+    # UID range of human users, see the common_uid_min/common_uid_max options
+    uid_min = 1000
+    uid_max = 1999
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, objname="common_users", keys=['pw_name', 'pw_uid', 'pw_gid', 
+                                                     'pw_gecos', 'pw_dir', 'pw_shell'], *args, **kwargs):
+        self.logger = logger.getChild(self.__class__.__name__)
+        super().__init__(self, *args, **kwargs)
+        self.keys = keys
+        self.objname = objname
+        self.logger.debug(f'objname={self.objname} keys={self.keys}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __iter__(self):
+        for user in self._get_users():
+            yield user
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _get_users(self, _uid_min=None, _uid_max=None):
+        _uid_min = self.uid_min if _uid_min is None else _uid_min
+        _uid_max = self.uid_max if _uid_max is None else _uid_max
+        users = set()
+        for user in filter(lambda u: _uid_min <= u.get('pw_uid') <= _uid_max, self.userdb.records()):
+            users.add(user.get('pw_name'))
+        return list(users)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def to_json(self, *args, **kwargs):
+        return self._get_users()
+
+
+########################################################################################################################
+class ProcessIndex(object):
+    # pid -> proc_* fields of the connections and sessions records: every distinct pid is looked up once per pass,
+    # not once per socket or session
+    prefix = 'proc_'
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, keys):
+        self.attrs = [k[len(self.prefix):] for k in keys if k.startswith(self.prefix)]
+        self._index = {}
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def get(self, pid):
+        if not self.attrs:
+            return {}
+        if pid not in self._index:
+            info = {}
+            if pid is not None:
+                try:
+                    info = psutil.Process(pid).as_dict(self.attrs, ad_value=None)
+                except psutil.NoSuchProcess:
+                    pass
+            self._index[pid] = {self.prefix + k: info.get(k) for k in self.attrs}
+        return self._index[pid]
+
+
+########################################################################################################################
+class Connections(object):
+    # One psutil.net_connections() pass for every socket on the system; Processes' 'connections' key rescans
+    # /proc/net/* and the fds once per process
+    usename = "connections"
+    # left out of a bare --json-output: a full socket scan on every dump
+    opt_in = True
+    all_keys = ['fd', 'family', 'type', 'status', 'laddr_ip', 'laddr_port', 'raddr_ip', 'raddr_port', 'pid',
+                'proc_name', 'proc_exe', 'proc_username']
+    identity = ('fd', 'pid', 'laddr_ip', 'laddr_port', 'raddr_ip', 'raddr_port', 'status')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, objname="connections", keys=['pid', 'family', 'type', 'status', 'laddr_ip', 'laddr_port',
+                                                    'raddr_ip', 'raddr_port', 'proc_name', 'proc_username']):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.keys = keys
+        self.objname = objname
+        self.converter = RecordConverter(self.identity)
+        # psutil.net_connections() kind: inet = TCP and UDP over IPv4 and IPv6
+        self.kind = 'inet'
+        self.logger.debug(f'objname={self.objname} keys={self.keys}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __iter__(self):
+        index = ProcessIndex(self.keys)
+        for c in psutil.net_connections(kind=self.kind):
+            # AF_UNIX addresses are paths; unconnected sockets have an empty raddr
+            laddr = (c.laddr, None) if isinstance(c.laddr, str) else (c.laddr or (None, None))
+            raddr = (c.raddr, None) if isinstance(c.raddr, str) else (c.raddr or (None, None))
+            d = {
+                'fd': None if c.fd == -1 else c.fd,
+                'family': getattr(c.family, 'name', str(c.family)),
+                'type': getattr(c.type, 'name', str(c.type)),
+                'status': c.status,
+                'laddr_ip': laddr[0],
+                'laddr_port': laddr[1],
+                'raddr_ip': raddr[0],
+                'raddr_port': raddr[1],
+                'pid': c.pid,
+            }
+            d.update(index.get(c.pid))
+            d = {k: d.get(k) for k in self.keys}
+            self.logger.debug(d)
+            yield d
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def to_json(self, all_keys=False):
+        _keys = list(self.keys)
+        if all_keys:
+            self.keys = list(self.all_keys)
+
+        D = {self.usename: []}
+        for d in self:
+            D[self.usename].append(d)
+
+        self.keys = list(_keys)
+
+        return D
+
+
+########################################################################################################################
+class Sessions(object):
+    # Logged-in users from one psutil.users() (utmp) pass, e.g. ssh, console and X sessions
+    usename = "sessions"
+    opt_in = True
+    all_keys = ['name', 'terminal', 'host', 'started', 'pid', 'proc_name', 'proc_exe', 'proc_username']
+    identity = ('name', 'terminal', 'started', 'pid')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, objname="sessions", keys=['name', 'terminal', 'host', 'started', 'pid', 'proc_name']):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.keys = keys
+        self.objname = objname
+        self.converter = RecordConverter(self.identity)
+        self.logger.debug(f'objname={self.objname} keys={self.keys}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __iter__(self):
+        index = ProcessIndex(self.keys)
+        for u in psutil.users():
+            d = dict(u._asdict())
+            d.update(index.get(d.get('pid')))
+            d = {k: d.get(k) for k in self.keys}
+            self.logger.debug(d)
+            yield d
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def to_json(self, all_keys=False):
+        _keys = list(self.keys)
+        if all_keys:
+            self.keys = list(self.all_keys)
+
+        D = {self.usename: []}
+        for d in self:
+            D[self.usename].append(d)
+
+        self.keys = list(_keys)
+
+        return D
+
+
+########################################################################################################################
+class RecordedSource(object):
+    # Stands in for a live source with the records of a snapshot file (--replay)
+    all_keys = []
+    lazy_records = None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, source, records):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.usename = source.usename
+        self.objname = source.objname
+        self.source = source
+        # the live source's (pruned) keys: recorded fields the expressions never read are dropped, missing ones are None
+        self.keys = list(source.keys)
+        # shared with the live source, so records repeated across snapshots are only converted once per worker
+        self.converter = getattr(source, 'converter', None)
+        self.list_type = getattr(source, 'list_type', None)
+        self.records = records
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __iter__(self):
+        # a binary snapshot only decodes the columns that are read
+        select = getattr(self.records, 'select', None)
+        for r in (select(self.keys) if select else self.records):
+            # common_users records are plain names
+            if isinstance(r, dict):
+                yield {k: r.get(k) for k in self.keys}
+            else:
+                yield r
+
+
+########################################################################################################################
+class SnapshotFile(object):
+    # Binary columnar snapshot (--snapshot-out / --snapshot-in), all integers little-endian whatever the host:
+    #
+    #   magic | u32 header length | JSON header | padding to 8 | data
+    #
+    # The header lists every source's record count and columns, with offsets relative to the data section. A column
+    # is an array of string ids ('str', 'json': JSON-encoded values), int64 ('int') or float64 ('float'), 8-byte
+    # aligned, plus one null byte per row when it has any None. Strings are interned in one table shared by all
+    # sources: u32 offsets (count + 1) followed by the UTF-8 bytes.
+    magic = b'CELSNAP1'
+    suffix = '.celsnap'
+    version = 1
+    formats = {'str': 'I', 'json': 'I', 'int': 'q', 'float': 'd'}
+    null_id = 0xFFFFFFFF
+    byteorder = 'little'
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, path):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(self.magic)] != self.magic:
+            raise ValueError(f'Not a {basename} snapshot: {repr(path)}')
+        _start = len(self.magic) + 4
+        _length = int.from_bytes(self._mm[len(self.magic):_start], self.byteorder)
+        self.header = json.loads(self._mm[_start:_start + _length])
+        if self.header.get('version') != self.version:
+            raise ValueError(f'Unsupported snapshot version: {repr(self.header.get("version"))}')
+        if self.header.get('byteorder') != self.byteorder:
+            raise ValueError(f'Unsupported snapshot byte order: {repr(self.header.get("byteorder"))}')
+        # arrays are read in place on little-endian hosts, copied and swapped on the others
+        self._swap = sys.byteorder != self.byteorder
+        self._data = self._align(_start + _length)
+
+        strings = self.header['strings']
+        self._offsets = self._array('I', strings['offsets'], strings['count'] + 1)
+        self._blob = self._data + strings['data']
+        self._strings = [None] * strings['count']
+        self.logger.debug(f'path={path} uses={list(self.header["sources"])} strings={strings["count"]}')
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @staticmethod
+    def _align(n):
+        return n + (-n % 8)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _array(self, fmt, offset, count):
+        start = self._data + offset
+        view = memoryview(self._mm)[start:start + count * array.array(fmt).itemsize].cast(fmt)
+        if self._swap:
+            view = array.array(fmt, view.tobytes())
+            view.byteswap()
+        return view
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def _bytes(cls, data):
+        if sys.byteorder != cls.byteorder:
+            data = array.array(data.typecode, data)
+            data.byteswap()
+        return data.tobytes()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def string(self, i):
+        # decoded on first use only
+        s = self._strings[i]
+        if s is None:
+            data = self._mm[self._blob + self._offsets[i]:self._blob + self._offsets[i + 1]]
+            s = self._strings[i] = data.decode('utf-8', 'surrogateescape')
+        return s
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def uses(self):
+        return list(self.header['sources'])
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def records(self, use):
+        return SnapshotRecords(self, use)
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def column(self, use, name):
+        # row -> value reader for one column; a column missing from the file reads as None
+        source = self.header['sources'][use]
+        column = source['columns'].get(name)
+        if column is None:
+            return lambda i: None
+        values = self._array(self.formats[column['type']], column['values'], source['count'])
+        nulls = self._array('B', column['nulls'], source['count']) if column.get('nulls') is not None else None
+        if column['type'] == 'str':
+            null_id, string = self.null_id, self.string
+            return lambda i: None if values[i] == null_id else string(values[i])
+        if column['type'] == 'json':
+            null_id, string = self.null_id, self.string
+            return lambda i: None if values[i] == null_id else json.loads(string(values[i]))
+        if nulls is not None:
+            return lambda i: None if nulls[i] else values[i]
+        return values.__getitem__
+
+    # ------------------------------------------------------------------------------------------------------------------
+    @classmethod
+    def write(cls, path, sources):
+        # sources: {use: [record, ...]}, records being flat dicts or, for common_users, scalars
+        strings = {}
+
+        def intern(v):
+            i = strings.get(v)
+            if i is None:
+                i = strings[v] = len(strings)
+            return i
+
+        blocks = []
+        size = 0
+
+        def block(data):
+            nonlocal size
+            offset = size
+            blocks.append(data + b'\0' * (-len(data) % 8))
+            size += len(blocks[-1])
+            return offset
+
+        header_sources = {}
+        for use, records in sources.items():
+            records = list(records)
+            scalar = not all(isinstance(r, dict) for r in records)
+            names = [''] if scalar else list(dict.fromkeys(k for r in records for k in r))
+            columns = {}
+            for name in names:
+                values = list(records) if scalar else [r.get(name) for r in records]
+                present = [v for v in values if v is not None]
+                if all(type(v) is str for v in present):
+                    _type = 'str'
+                elif all(type(v) is int and -2 ** 63 <= v < 2 ** 63 for v in present):
+                    _type = 'int'
+                elif all(type(v) is float for v in present):
+                    _type = 'float'
+                else:
+                    _type = 'json'
+                if _type == 'str':
+                    data = array.array('I', (cls.null_id if v is None else intern(v) for v in values))
+                elif _type == 'json':
+                    data = array.array('I', (cls.null_id if v is None else intern(json.dumps(v, default=str))
+                                             for v in values))
+                else:
+                    data = array.array(cls.formats[_type], (0 if v is None else v for v in values))
+                nulls = None
+                if _type in ('int', 'float') and len(present) != len(values):
+                    nulls = block(bytes(v is None for v in values))
+                columns[name] = {'type': _type, 'values': block(cls._bytes(data)), 'nulls': nulls}
+            header_sources[use] = {'count': len(records), 'scalar': scalar, 'columns': columns}
+
+        # psutil returns paths that are not valid UTF-8 with surrogate escapes, see os.fsdecode()
+        encoded = [v.encode('utf-8', 'surrogateescape') for v in strings]
+        offsets = array.array('I', [0])
+        for b in encoded:
+            offsets.append(offsets[-1] + len(b))
+        header = {
+            'version': cls.version,
+            'byteorder': cls.byteorder,
+            'created': time.time(),
+            'celular': __VERSION__,
+            'hostname': socket.gethostname(),
+            'sources': header_sources,
+            'strings': {'count': len(encoded), 'offsets': block(cls._bytes(offsets)), 'data': block(b''.join(encoded))},
+        }
+        _header = json.dumps(header).encode()
+        prefix = cls.magic + len(_header).to_bytes(4, cls.byteorder) + _header
+        prefix += b'\0' * (-len(prefix) % 8)
+
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(prefix)
+            for data in blocks:
+                f.write(data)
+        os.replace(tmp, path)
+        return len(prefix) + size
+
+
+########################################################################################################################
+class SnapshotRecords(object):
+    # One source of a SnapshotFile; iterating decodes every column, select() only the given ones
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, snapshot, use):
+        self.snapshot = snapshot
+        self.use = use
+        self.header = snapshot.header['sources'][use]
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __len__(self):
+        return self.header['count']
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __iter__(self):
+        return self.select(list(self.header['columns']))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def select(self, keys):
+        count = self.header['count']
+        if self.header['scalar']:
+            get = self.snapshot.column(self.use, '')
+            return (get(i) for i in range(count))
+        getters = [(k, self.snapshot.column(self.use, k)) for k in keys]
+        return ({k: get(i) for k, get in getters} for i in range(count))
+
+
+########################################################################################################################
+def to_json(uses=[], all_keys=False):
+    e = Expressions(environment=None, _init=False)
+    D = {}
+    if not uses:
+        uses.extend(e._uses.keys())
+    
+    for k in filter(lambda u: u in uses, e._uses):
+        obj = e._uses.get(k)
         val = obj.to_json(all_keys)
         if isinstance(val, dict):
             D[k] = val
@@ -463,31 +2877,627 @@ def to_json(uses=[], all_keys=False):
 
 
 ########################################################################################################################
-def service(config):
+def _select_keys(obj, all_keys=False, fields=None):
+    if obj.all_keys:
+        keys = list(obj.all_keys) if all_keys else list(obj.keys)
+        if fields:
+            keys = [f for f in fields if f in obj.all_keys]
+        obj.keys = keys
+        if isinstance(obj, Processes):
+            # empty attrs = every psutil attribute
+            obj._process_iter_attrs = [] if all_keys and not fields else (keys or ['pid'])
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def to_ndjson(uses=None, all_keys=False, fields=None, stream=None, options=None):
+    # One {"use": ..., "record": {...}} line per record, written and flushed as each record is collected, so memory
+    # stays bounded by a single record however large the tables and --json-output-all fields get.
+    stream = stream or sys.stdout
+    e = Expressions(environment=None, _init=False, options=options)
+    uses = uses or list(e._uses.keys())
+    n = 0
+    for k in filter(lambda u: u in uses, e._uses):
+        obj = e._uses.get(k)
+        _select_keys(obj, all_keys, fields)
+        try:
+            for d in obj:
+                stream.write(json.dumps({'use': k, 'record': d}, default=str) + '\n')
+                stream.flush()
+                n += 1
+        except BrokenPipeError:
+            # reader went away, e.g. | head
+            return n
+    return n
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def to_snapshot(path, uses=None, all_keys=False, fields=None, options=None):
+    # --snapshot-out: the same records as --json-output, in a SnapshotFile
+    e = Expressions(environment=None, _init=False, options=options)
+    uses = uses or list(e._uses.keys())
+    sources = {}
+    for k in filter(lambda u: u in uses, e._uses):
+        obj = e._uses.get(k)
+        _select_keys(obj, all_keys, fields)
+        sources[k] = list(obj)
+    size = SnapshotFile.write(path, sources)
+    logger.info(f'snapshot={path} size={size} records={ {k: len(v) for k, v in sources.items()} }')
+    return size
+
+
+########################################################################################################################
+def service(config, all_results=False, snapshot_in=None):
     system_in_use = True
     try:
-        CEL_ENV = celpy.Environment()
-        check_expressions = Expressions(CEL_ENV, config.expressions)
-        #print(check_expressions.evaluate_until_one())  # e.g. True
-        results = check_expressions.evaluate_for_each()
-        system_in_use = any(results)
-        #print(results)  # e.g. [True, True, True, True]
+        CEL_ENV = LazyEnvironment()
+        check_expressions = Expressions(CEL_ENV, config.expressions, cache=CompiledCache(config),
+                                        options=config.options, bindings=config.bindings)
+        stats = None
+        if snapshot_in:
+            # recorded state: its timings and hit rates say nothing about this host
+            check_expressions.use_recorded(load_snapshot(snapshot_in))
+        else:
+            stats = ExpressionStats(config).load()
+        if all_results:
+            results = check_expressions.evaluate_for_each(stats=stats)
+            system_in_use = any(results)
+            #print(results)  # e.g. [True, True, True, True]
+        else:
+            # the first true result decides the exit code; cheap, likely hits are evaluated first
+            system_in_use = check_expressions.evaluate_until_one(stats=stats)
+        if stats:
+            stats.save()
     except Exception as E:
         print(repr(E), file=sys.stderr)
         system_in_use = True
     return int(system_in_use)
 
 
+########################################################################################################################
+def service_many(paths, all_results=False):
+    # Several policies, one collection: the sources (and their collection options) of the first config that loads
+    # gather every record key any policy reads, each policy is evaluated against the same snapshot and structurally
+    # equal expressions are evaluated once. One JSON verdict line per policy; non-zero if any policy is in use.
+    policies = []
+    for path in paths:
+        verdict = {'config': path, 'in_use': True, 'exit_code': 1, 'results': [], 'error': None}
+        try:
+            config = Config(path)
+            expressions = Expressions(LazyEnvironment(), config.expressions, cache=CompiledCache(config),
+                                      options=config.options, bindings=config.bindings)
+            policies.append((verdict, config, expressions))
+        except Exception as E:
+            verdict['error'] = repr(E)
+            policies.append((verdict, None, None))
+
+    loaded = [expressions for verdict, config, expressions in policies if expressions is not None]
+    snapshot = None
+    if loaded:
+        loaded[0].share_sources(loaded[1:])
+        snapshot = loaded[0].new_snapshot()
+
+    for verdict, config, expressions in policies:
+        if expressions is not None:
+            try:
+                stats = ExpressionStats(config).load()
+                if all_results:
+                    verdict['results'] = expressions.evaluate_for_each(snapshot, stats, config.cel_env_objects)
+                    verdict['in_use'] = any(verdict['results'])
+                else:
+                    verdict['in_use'] = expressions.evaluate_until_one(snapshot, stats, config.cel_env_objects)
+                stats.save()
+            except Exception as E:
+                # fail-safe, per policy
+                verdict['in_use'] = True
+                verdict['error'] = repr(E)
+            verdict['exit_code'] = int(verdict['in_use'])
+        print(json.dumps(verdict), flush=True)
+
+    if snapshot is not None:
+        logger.info(f'policies={len(paths)} shared={len(snapshot.results)} snapshot stats={snapshot.stats()}')
+    return int(any(verdict['in_use'] for verdict, config, expressions in policies))
+
+
+########################################################################################################################
+class Daemon(object):
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, config, socket_path=None, interval=None, metrics_textfile=None):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.config = config
+        self.socket_path = socket_path or config.options.get('daemon_socket', DEFAULT_SOCKET_PATH)
+        self.interval = float(interval or config.options.get('daemon_interval', DEFAULT_DAEMON_INTERVAL))
+        self.metrics_textfile = metrics_textfile or config.options.get('metrics_textfile')
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.state = {'exit_code': 1, 'in_use': True, 'results': [], 'timestamp': None, 'error': 'starting'}
+
+        self.expressions = Expressions(LazyEnvironment(), config.expressions, cache=CompiledCache(config),
+                                       options=config.options, bindings=config.bindings)
+        # swap the one-shot collector for a live table that only fetches attributes for new PIDs
+        procs = self.expressions._uses[Processes.usename]
+        self.table = ProcessTable(procs.objname, procs.keys, config.options.get('daemon_refresh_keys'))
+        self.table._process_iter_attrs = procs._process_iter_attrs
+        self.expressions._uses[Processes.usename] = self.table
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def evaluate(self):
+        start = time.time()
+        # export the cost of this pass only
+        PROFILE.reset()
+        try:
+            with PROFILE.stage('refresh', use=Processes.usename) as stage:
+                new, gone = self.table.refresh()
+                stage['records'] = len(self.table._table)
+            results = self.expressions.evaluate_for_each(snapshot=self.expressions.new_snapshot())
+            in_use = any(results)
+            state = {'exit_code': int(in_use), 'in_use': in_use, 'results': results, 'error': None}
+            self.logger.info(f'in_use={in_use} results={results} procs={len(self.table._table)} new={new} gone={gone}')
+        except Exception as E:
+            # fail-safe, same as service(): any error reports the system as in use
+            state = {'exit_code': 1, 'in_use': True, 'results': [], 'error': repr(E)}
+            self.logger.error(f'evaluate error={repr(E)}')
+        state['timestamp'] = start
+        state['duration'] = round(time.time() - start, 6)
+        state['interval'] = self.interval
+        with self.lock:
+            self.state = state
+        if self.metrics_textfile:
+            PROFILE.write_textfile(self.metrics_textfile, in_use=state['in_use'])
+        return state
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def response(self):
+        with self.lock:
+            return json.dumps(self.state).encode('utf-8') + b'\n'
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def serve(self):
+        daemon = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                self.request.sendall(daemon.response())
+
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        server.daemon_threads = True
+        os.chmod(self.socket_path, int(str(self.config.options.get('daemon_socket_mode', '660')), 8))
+        thread = threading.Thread(target=server.serve_forever, name='celular-socket', daemon=True)
+        thread.start()
+        self.logger.info(f'socket={self.socket_path} interval={self.interval}')
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: self.stop.set())
+        try:
+            while not self.stop.is_set():
+                self.evaluate()
+                self.stop.wait(self.interval)
+        finally:
+            server.shutdown()
+            server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        return 0
+
+
+########################################################################################################################
+class Watcher(object):
+    # Re-evaluates on change signals instead of a timer: mount table changes (poll() on /proc/self/mounts), process
+    # fork/exec/exit (proc connector netlink, or a /proc PID-set diff without CAP_NET_ADMIN), /etc/passwd changes,
+    # and for connections and sessions a /proc/net fingerprint and the utmp mtime.
+    # A chdir raises no signal at all, hence the full re-evaluation every interval seconds.
+    mounts_path = '/proc/self/mounts'
+    # connections and sessions raise no event: /proc/net and utmp are compared on every tick
+    net_paths = ('/proc/net/tcp', '/proc/net/tcp6', '/proc/net/udp', '/proc/net/udp6')
+    utmp_path = '/var/run/utmp'
+    # linux/netlink.h, linux/connector.h, linux/cn_proc.h
+    NETLINK_CONNECTOR = 11
+    CN_IDX_PROC = CN_VAL_PROC = 1
+    PROC_CN_MCAST_LISTEN = 1
+    NLMSG_DONE = 3
+    PROC_EVENT_FORK = 0x00000001
+    PROC_EVENT_EXEC = 0x00000002
+    PROC_EVENT_UID = 0x00000004
+    PROC_EVENT_COMM = 0x00000200
+    PROC_EVENT_EXIT = 0x80000000
+    proc_events = PROC_EVENT_FORK | PROC_EVENT_EXEC | PROC_EVENT_UID | PROC_EVENT_COMM | PROC_EVENT_EXIT
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def __init__(self, config, interval=None, all_results=False, metrics_textfile=None, stream=None):
+        self.logger = logger.getChild(self.__class__.__name__)
+        self.config = config
+        self.interval = float(interval or config.options.get('watch_interval', DEFAULT_WATCH_INTERVAL))
+        self.debounce = float(config.options.get('watch_debounce', DEFAULT_WATCH_DEBOUNCE))
+        # a steady stream of forks must not postpone the evaluation forever
+        self.debounce_max = float(config.options.get('watch_debounce_max', 10 * self.debounce))
+        self.tick = float(config.options.get('watch_poll', 1.0))
+        self.all_results = all_results
+        self.metrics_textfile = metrics_textfile or config.options.get('metrics_textfile')
+        self.stream = stream or sys.stdout
+        self.stop = threading.Event()
+        # exprno -> last result, in_use and per-expression results of the last emitted verdict
+        self.results = {}
+        self.in_use = None
+        self.emitted = None
+        self.snapshot = None
+
+        self.expressions = Expressions(LazyEnvironment(), config.expressions, cache=CompiledCache(config),
+                                       options=config.options, bindings=config.bindings)
+        procs = self.expressions._uses[Processes.usename]
+        self.table = ProcessTable(procs.objname, procs.keys, config.options.get('daemon_refresh_keys'))
+        self.table._process_iter_attrs = procs._process_iter_attrs
+        self.expressions._uses[Processes.usename] = self.table
+        self.watched = set(u for x in self.expressions._expressions.values() for u in x.get('uses'))
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _proc_connector(self):
+        if not self.config.options.get('watch_proc_connector', True):
+            return None
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, self.NETLINK_CONNECTOR)
+            sock.bind((0, self.CN_IDX_PROC))
+            payload = struct.pack('=IIIIHH', self.CN_IDX_PROC, self.CN_VAL_PROC, 0, 0, 4, 0) \
+                      + struct.pack('=I', self.PROC_CN_MCAST_LISTEN)
+            sock.send(struct.pack('=IHHII', 16 + len(payload), self.NLMSG_DONE, 0, 0, 0) + payload)
+            sock.setblocking(False)
+            return sock
+        except (OSError, AttributeError) as E:
+            # needs CAP_NET_ADMIN (and Linux): fall back to diffing the PID set
+            self.logger.info(f'proc_connector=unavailable error={repr(E)}')
+            return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _drain_proc_connector(self, sock):
+        changed = False
+        while True:
+            try:
+                data = sock.recv(65536)
+            except BlockingIOError:
+                return changed
+            except OSError as E:
+                if E.errno != errno.ENOBUFS:
+                    raise
+                # the socket buffer overflowed and events were dropped: whatever they were, assume processes changed
+                self.logger.info('proc connector overrun')
+                changed = True
+                continue
+            # nlmsghdr (16) + cn_msg (20) + proc_event.what
+            if len(data) >= 40 and struct.unpack_from('=I', data, 36)[0] & self.proc_events:
+                changed = True
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _pids(self):
+        return set(n for n in os.listdir('/proc') if n.isdigit())
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def _net_fingerprint(self):
+        # addresses, state and inode of every socket; queue sizes and timers change all the time and are left out
+        h = hashlib.sha256()
+        for path in self.net_paths:
+            try:
+                with open(path) as f:
+                    lines = f.readlines()[1:]
+            except OSError:
+                continue
+            for fields in sorted(line.split() for line in lines):
+                h.update(' '.join(fields[1:4] + fields[9:10]).encode('utf-8') + b'\n')
+        return h.digest()
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def evaluate(self, changed=None):
+        # changed: uses with a change signal since the last evaluation, None for everything
+        start = time.time()
+        PROFILE.reset()
+        changed = set(self.watched) if changed is None or not self.results else set(changed) & self.watched
+        error = None
+        try:
+            if Processes.usename in changed:
+                with PROFILE.stage('refresh', use=Processes.usename) as stage:
+                    self.table.refresh()
+                    stage['records'] = len(self.table._table)
+            snapshot = self.expressions.new_snapshot()
+            if self.snapshot is not None:
+                snapshot.carry(self.snapshot, [u for u in self.watched if u not in changed])
+            subset = {i: x for i, x in self.expressions._expressions.items() if changed & set(x.get('uses'))}
+            if subset:
+                for i, result in self.expressions._iter_eval_indexed(expressions=subset, snapshot=snapshot):
+                    self.results[i] = bool(result)
+            self.snapshot = snapshot
+            in_use = any(self.results.values())
+        except Exception as E:
+            # fail-safe: report in use and start over with a full evaluation
+            self.logger.error(f'evaluate error={repr(E)}')
+            self.results = {}
+            self.snapshot = None
+            in_use, error = True, repr(E)
+            subset = {}
+        results = [self.results.get(i) for i in sorted(self.expressions._expressions)]
+        self.logger.info(f'in_use={in_use} changed={sorted(changed)} evaluated={sorted(subset)} '
+                         f'duration={time.time() - start:.6f}')
+        if self.metrics_textfile:
+            PROFILE.write_textfile(self.metrics_textfile, in_use=in_use)
+
+        previous, self.in_use = self.in_use, in_use
+        if in_use == previous and not error and (not self.all_results or results == self.emitted):
+            return None
+        self.emitted = results
+        event = {'event': 'verdict', 'in_use': in_use, 'exit_code': int(in_use), 'previous': previous,
+                 'changed': sorted(changed), 'evaluated': sorted(subset), 'timestamp': start, 'error': error}
+        if self.all_results:
+            event['results'] = results
+        print(json.dumps(event), file=self.stream, flush=True)
+        return event
+
+    # ------------------------------------------------------------------------------------------------------------------
+    def run(self):
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *args: self.stop.set())
+
+        poller = select.poll()
+        mounts = open(self.mounts_path, 'rb')
+        mounts.read()
+        # the kernel flags POLLPRI|POLLERR on the open file whenever the mount table changes
+        poller.register(mounts, select.POLLPRI | select.POLLERR)
+        connector = self._proc_connector() if Processes.usename in self.watched else None
+        if connector is not None:
+            poller.register(connector, select.POLLIN)
+        pids = self._pids() if connector is None else None
+        passwd = self._mtime(UserDB.passwd)
+        utmp = self._mtime(self.utmp_path)
+        net = self._net_fingerprint() if Connections.usename in self.watched else None
+        self.logger.info(f'watch uses={sorted(self.watched)} proc_connector={connector is not None} '
+                         f'debounce={self.debounce} interval={self.interval}')
+
+        pending = set()
+        first = last = None
+        try:
+            self.evaluate()
+            next_full = next_tick = time.monotonic()
+            next_full += self.interval
+            while not self.stop.is_set():
+                now = time.monotonic()
+                timeout = min(next_tick, next_full) - now
+                if pending:
+                    timeout = min(timeout, last + self.debounce - now, first + self.debounce_max - now)
+                signals = set()
+                for fd, mask in poller.poll(max(0.0, timeout) * 1000):
+                    if fd == mounts.fileno():
+                        mounts.seek(0)
+                        mounts.read()
+                        signals.add(Mounts.usename)
+                    elif connector is not None and fd == connector.fileno():
+                        if self._drain_proc_connector(connector):
+                            signals.add(Processes.usename)
+
+                now = time.monotonic()
+                if now >= next_tick:
+                    next_tick = now + self.tick
+                    if pids is not None:
+                        _pids = self._pids()
+                        if _pids != pids:
+                            pids = _pids
+                            signals.add(Processes.usename)
+                    _passwd = self._mtime(UserDB.passwd)
+                    if _passwd != passwd:
+                        passwd = _passwd
+                        signals.update((Users.usename, CommonUsers.usename))
+                    _utmp = self._mtime(self.utmp_path)
+                    if _utmp != utmp:
+                        utmp = _utmp
+                        signals.add(Sessions.usename)
+                    if net is not None:
+                        _net = self._net_fingerprint()
+                        if _net != net:
+                            net = _net
+                            signals.add(Connections.usename)
+
+                signals &= self.watched
+                if signals:
+                    self.logger.debug(f'signals={sorted(signals)}')
+                    pending |= signals
+                    first = first or now
+                    last = now
+                if now >= next_full:
+                    self.evaluate()
+                    pending.clear()
+                    first = last = None
+                    next_full = now + self.interval
+                elif pending and (now - last >= self.debounce or now - first >= self.debounce_max):
+                    self.evaluate(pending)
+                    pending.clear()
+                    first = last = None
+        finally:
+            mounts.close()
+            if connector is not None:
+                connector.close()
+        return 0
+
+
+########################################################################################################################
+def query(socket_path=None, timeout=2.0):
+    # Thin client for a running --daemon: same exit-code contract as service(), non-zero (in use) on any doubt
+    socket_path = socket_path or DEFAULT_SOCKET_PATH
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.settimeout(timeout)
+            s.connect(socket_path)
+            chunks = []
+            while True:
+                chunk = s.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        state = json.loads(b''.join(chunks))
+    except (OSError, ValueError) as E:
+        print(repr(E), file=sys.stderr)
+        return 1
+
+    # an answer older than a few evaluation intervals means the daemon is wedged
+    if state.get('timestamp') is None or time.time() - state['timestamp'] > 3 * state.get('interval', 0) + timeout:
+        print(f'Stale daemon state: {repr(state.get("timestamp"))}', file=sys.stderr)
+        return 1
+    print(json.dumps(state))
+    return int(state.get('exit_code', 1))
+
+
+########################################################################################################################
+def parity_check(keys=None):
+    # Compare the procfs collector against psutil for every PID both scans saw; non-zero on any difference
+    keys = list(keys or ProcFSCollector.fields)
+    if not ProcFSCollector.available():
+        print('procfs collector unavailable on this platform', file=sys.stderr)
+        return 1
+    collector = ProcFSCollector(keys)
+    by_procfs = {d['pid']: d for d in collector.infos(collector.pids())}
+    by_psutil = {p.info['pid']: p.info for p in psutil.process_iter(sorted(set(keys) | {'pid'}))}
+
+    common = sorted(set(by_procfs) & set(by_psutil))
+    mismatches = []
+    for pid in common:
+        for k in keys:
+            if by_procfs[pid].get(k) != by_psutil[pid].get(k):
+                mismatches.append({'pid': pid, 'key': k, 'procfs': by_procfs[pid].get(k),
+                                   'psutil': by_psutil[pid].get(k)})
+    print(json.dumps({
+        'keys': keys,
+        'checked': len(common),
+        'only_procfs': sorted(set(by_procfs) - set(by_psutil)),
+        'only_psutil': sorted(set(by_psutil) - set(by_procfs)),
+        'mismatches': mismatches,
+    }))
+    return int(bool(mismatches))
+
+
+########################################################################################################################
+SNAPSHOT_SUFFIXES = ('.json', '.ndjson', SnapshotFile.suffix)
+# per replay worker process: the compiled Expressions
+_REPLAY = None
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def load_snapshot(path):
+    # {use: [record, ...]} from a --json-output dump, its --json-output-format=ndjson stream or a --snapshot-out file
+    if path.endswith(SnapshotFile.suffix):
+        snapshot = SnapshotFile(path)
+        return {use: snapshot.records(use) for use in snapshot.uses()}
+    snapshot = {}
+    with open(path, 'r') as f:
+        if path.endswith('.ndjson'):
+            for line in f:
+                if line.strip():
+                    d = json.loads(line)
+                    snapshot.setdefault(d['use'], []).append(d['record'])
+            return snapshot
+        D = json.load(f)
+    for use, val in D.items():
+        # to_json() nests every source as {use: {use: [...]}}
+        snapshot[use] = val.get(use, []) if isinstance(val, dict) else val
+    return snapshot
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _replay_init(config_path):
+    global GLOBALS, VARS, CEL_ENV_OBJECTS, _REPLAY
+    # compiled once per worker; every worker after the first is served by the CompiledCache
+    config = Config(config_path)
+    GLOBALS, VARS, CEL_ENV_OBJECTS = config.globals, config.vars, config.cel_env_objects
+    expressions = Expressions(LazyEnvironment(), config.expressions, cache=CompiledCache(config),
+                              options=config.options, bindings=config.bindings)
+    _REPLAY = expressions
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def _replay_one(path):
+    expressions = _REPLAY
+    start = time.perf_counter()
+    verdict = {'snapshot': path, 'in_use': True, 'results': [], 'error': None}
+    try:
+        expressions.use_recorded(load_snapshot(path))
+        results = expressions.evaluate_for_each(snapshot=expressions.new_snapshot())
+        verdict['in_use'] = any(results)
+        verdict['results'] = results
+    except Exception as E:
+        # fail-safe, same as service()
+        verdict['error'] = repr(E)
+    verdict['time'] = round(time.perf_counter() - start, 6)
+    return verdict
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def replay(config, directory, workers=None):
+    # One verdict line per snapshot file, in file name order; non-zero if any snapshot is in use or failed
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.endswith(SNAPSHOT_SUFFIXES) and os.path.isfile(os.path.join(directory, name)))
+    if not paths:
+        print(f'No snapshots in {repr(directory)}', file=sys.stderr)
+        return -1
+    workers = max(1, min(int(workers or os.cpu_count() or 1), len(paths)))
+
+    n = in_use = errors = 0
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_replay_init,
+                                                initargs=(config.path,)) as pool:
+        for verdict in pool.map(_replay_one, paths, chunksize=max(1, len(paths) // (workers * 4))):
+            print(json.dumps(verdict), flush=True)
+            n += 1
+            in_use += int(verdict['in_use'])
+            errors += int(verdict['error'] is not None)
+    elapsed = time.perf_counter() - start
+    print(f'snapshots={n} in_use={in_use} errors={errors} workers={workers} seconds={elapsed:.3f}'
+          f' rate={n / elapsed:.1f}/s', file=sys.stderr)
+    return int(bool(in_use or errors))
+
+
+########################################################################################################################
+def _report_profile(exit_code, profile=False, metrics_textfile=None):
+    if profile:
+        print(json.dumps(PROFILE.report()))
+    if metrics_textfile:
+        PROFILE.write_textfile(metrics_textfile, in_use=exit_code)
+    return exit_code
+
+
 ########################################################################################################################
 def main(argv):
     global GLOBALS, VARS, CEL_ENV_OBJECTS
 
-    uses = list(Expressions(environment=None, _init=False)._uses.keys())
+    sources = Expressions(environment=None, _init=False)._uses
+    uses = list(sources.keys())
     opt_config_file = None
+    opt_config_files = []
     opt_json_output = False
     opt_json_output_all = False
     opt_uses = set()
-    usage_str = f'{basename} [--json-output[={"][,".join(uses)}] [--json-output-all] [--config=/path/to/config.json]'
+    opt_json_output_format = 'json'
+    opt_json_output_fields = None
+    opt_all_results = False
+    opt_parity_check = False
+    opt_daemon = False
+    opt_watch = False
+    opt_query = False
+    opt_socket = None
+    opt_interval = None
+    opt_snapshot_out = None
+    opt_snapshot_in = None
+    opt_replay = None
+    opt_replay_workers = None
+    opt_profile = False
+    opt_metrics_textfile = None
+    usage_str = f'{basename} [--json-output[={"][,".join(uses)}] [--json-output-all]' \
+                f' [--json-output-format=json|ndjson] [--json-output-fields=name[,...]] [--config=/path/to/config.json ...]' \
+                f' [--all-results] [--parity-check] [--daemon|--watch [--interval=seconds]] [--query] [--socket=/path/to/{basename}.sock]' \
+                f' [--profile] [--metrics-textfile=/path/to/{basename}.prom]' \
+                f' [--replay=/path/to/snapshots [--replay-workers=N]]' \
+                f' [--snapshot-out=/path/to/host{SnapshotFile.suffix}] [--snapshot-in=/path/to/host{SnapshotFile.suffix}]'
 
     for arg in argv:
         argl = arg.lower()
@@ -499,9 +3509,21 @@ def main(argv):
                     return -1
                 opt_uses.add(v)
         if argl == '--json-output':
-            opt_uses = set(uses)
+            opt_json_output = True
         if argl == '--json-output-all':
             opt_json_output_all = True
+        if argl.startswith('--json-output-format='):
+            _arg, _sep, opt_json_output_format = argl.partition('=')
+            if opt_json_output_format not in ('json', 'ndjson'):
+                print(f'Unknown format: {repr(opt_json_output_format)}', file=sys.stderr)
+                return -1
+        if argl.startswith('--json-output-fields='):
+            _arg, _sep, _val = arg.partition('=')
+            opt_json_output_fields = [v for v in _val.split(',') if v]
+            for v in opt_json_output_fields:
+                if not any(v in (source.all_keys or ()) for source in sources.values()):
+                    print(f'Unknown field: {repr(v)}', file=sys.stderr)
+                    return -1
         if argl.startswith('--config='):
             _arg, _sep, _val = arg.partition('=')
             _path = os.path.abspath(_val)
@@ -509,23 +3531,110 @@ def main(argv):
                 print(f'Unknown file: {repr(_path)}', file=sys.stderr)
                 return -1
             opt_config_file = _path
+            opt_config_files.append(_path)
+        if argl == '--all-results':
+            opt_all_results = True
+        if argl == '--parity-check':
+            opt_parity_check = True
+        if argl == '--daemon':
+            opt_daemon = True
+        if argl == '--watch':
+            opt_watch = True
+        if argl == '--query':
+            opt_query = True
+        if argl.startswith('--socket='):
+            _arg, _sep, opt_socket = arg.partition('=')
+        if argl.startswith('--interval='):
+            _arg, _sep, _val = arg.partition('=')
+            try:
+                opt_interval = float(_val)
+            except ValueError:
+                print(f'Invalid interval: {repr(_val)}', file=sys.stderr)
+                return -1
+        if argl.startswith('--snapshot-out='):
+            _arg, _sep, _val = arg.partition('=')
+            opt_snapshot_out = os.path.abspath(_val)
+        if argl.startswith('--snapshot-in='):
+            _arg, _sep, _val = arg.partition('=')
+            opt_snapshot_in = os.path.abspath(_val)
+            if not os.path.isfile(opt_snapshot_in):
+                print(f'Unknown file: {repr(opt_snapshot_in)}', file=sys.stderr)
+                return -1
+        if argl.startswith('--replay='):
+            _arg, _sep, _val = arg.partition('=')
+            opt_replay = os.path.abspath(_val)
+            if not os.path.isdir(opt_replay):
+                print(f'Unknown directory: {repr(opt_replay)}', file=sys.stderr)
+                return -1
+        if argl.startswith('--replay-workers='):
+            _arg, _sep, _val = arg.partition('=')
+            try:
+                opt_replay_workers = int(_val)
+            except ValueError:
+                print(f'Invalid workers: {repr(_val)}', file=sys.stderr)
+                return -1
+        if argl == '--profile':
+            opt_profile = True
+        if argl.startswith('--metrics-textfile='):
+            _arg, _sep, _val = arg.partition('=')
+            opt_metrics_textfile = os.path.abspath(_val)
         if argl == '--help':
             print(BANNER)
             print(usage_str)
             return -1
     
+    if opt_query:
+        return query(opt_socket)
+
+    if opt_parity_check:
+        return parity_check()
+
     opt_config_file = opt_config_file or DEFAULT_CONFIG_PATH
-    config = Config(opt_config_file)
+    # a handful of clock reads per stage: always measured, only reported on request
+    PROFILE.enabled = True
+    if len(opt_config_files) > 1:
+        # one collection pass for every policy, one JSON verdict line each; a broken config only fails its own
+        with PROFILE.stage('service'):
+            exit_code = service_many(opt_config_files, all_results=opt_all_results)
+        return _report_profile(exit_code, opt_profile, opt_metrics_textfile)
+
+    with PROFILE.stage('config') as stage:
+        config = Config(opt_config_file)
+        stage['records'] = len(config.expressions)
+    opt_metrics_textfile = opt_metrics_textfile or config.options.get('metrics_textfile')
     
     GLOBALS, VARS, CEL_ENV_OBJECTS = config.globals, config.vars, config.cel_env_objects
 
+    if opt_replay:
+        return replay(config, opt_replay, opt_replay_workers)
+
+    if (opt_json_output or opt_snapshot_out) and not opt_uses:
+        # connections and sessions only when named or with --json-output-all
+        opt_uses = set(u for u, source in sources.items() if opt_json_output_all or not getattr(source, 'opt_in', False))
+
+    if opt_snapshot_out:
+        to_snapshot(opt_snapshot_out, uses=list(opt_uses), all_keys=opt_json_output_all,
+                    fields=opt_json_output_fields, options=config.options)
+        return 0
+
     opt_json_output = any(opt_uses) or opt_json_output_all
+    if opt_json_output and opt_json_output_format == 'ndjson':
+        to_ndjson(uses=list(opt_uses), all_keys=opt_json_output_all, fields=opt_json_output_fields,
+                  options=config.options)
+        return 0
     if opt_json_output:
         print(to_json(uses=list(opt_uses), all_keys=opt_json_output_all))
         return 0
+
+    if opt_watch:
+        return Watcher(config, opt_interval, opt_all_results, opt_metrics_textfile).run()
+
+    if opt_daemon:
+        return Daemon(config, opt_socket, opt_interval, opt_metrics_textfile).serve()
     
-    exit_code = service(config)
-    return exit_code
+    with PROFILE.stage('service'):
+        exit_code = service(config, all_results=opt_all_results, snapshot_in=opt_snapshot_in)
+    return _report_profile(exit_code, opt_profile, opt_metrics_textfile)
 
 
 ########################################################################################################################
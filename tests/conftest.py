@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import celular
+
+# keep per-evaluation log lines out of the test output
+logging.disable(logging.INFO)
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SHIPPED_CONFIGS = [
+    os.path.join(ROOT, 'celular.json'),
+    os.path.join(ROOT, 'examples', 'celular.confg.example.json'),
+]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def procs_table(n, overrides=None):
+    # deterministic process records; overrides: {pid: {key: value}}
+    records = []
+    for pid in range(1, n + 1):
+        d = {
+            'pid': pid,
+            'ppid': max(1, pid // 10),
+            'name': f'worker{pid % 20}',
+            'exe': f'/opt/svc/bin/worker{pid % 20}',
+            'cwd': f'/var/lib/svc{pid % 5}',
+            'username': 'svc',
+            'create_time': 1700000000.0 + pid,
+        }
+        d.update((overrides or {}).get(pid, {}))
+        records.append(d)
+    return records
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def recorded_tables(procs=None, mounts=None, common_users=None):
+    return {
+        'processes': procs if procs is not None else procs_table(50),
+        'mounts': mounts if mounts is not None else [{'device': '/dev/vda1', 'mountpoint': '/'}],
+        'common_users': common_users if common_users is not None else ['alice'],
+        'users': [],
+        'connections': [],
+        'sessions': [],
+    }
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def load_expressions(config, **options):
+    # never read or write the on-disk caches
+    options = dict(config.options, users_cache=False, **options)
+    return celular.Expressions(celular.LazyEnvironment(), config.expressions, options=options,
+                               bindings=config.bindings)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def outcome(fun):
+    try:
+        result = fun()
+    except Exception as E:
+        return type(E).__name__
+    return [bool(r) for r in result] if isinstance(result, list) else bool(result)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def evaluate(config, tables, until_one=False, **options):
+    # the verdict (until_one) or every expression's result on recorded tables, errors as the exception name
+    expressions = load_expressions(config, **options)
+    expressions.use_recorded({u: tables[u] for u in tables})
+    objects = dict(config.cel_env_objects)
+    if until_one:
+        return outcome(lambda: expressions.evaluate_until_one(cel_env_objects=objects))
+    return outcome(lambda: expressions.evaluate_for_each(cel_env_objects=objects))
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.fixture
+def make_config(tmp_path):
+    def make(expressions, globals=None, vars=None, options=None):
+        path = tmp_path / 'celular.json'
+        path.write_text(json.dumps({'spec': '0.1.0-beta', 'config': {
+            'globals': globals or {'username': 'admin'},
+            'vars': vars or {},
+            'options': options or {},
+            'expressions': [e if isinstance(e, dict) else {'uses': ['processes'], 'expr': e} for e in expressions],
+        }}))
+        return celular.Config(str(path))
+    return make
@@ -0,0 +1,28 @@
+import lark
+
+import celular
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_compiled_cache_key_covers_source_and_lark(make_config, tmp_path, monkeypatch):
+    config = make_config(["procs.exists(p, p['name'] == 'sshd')"])
+    key = celular.CompiledCache(config, path=str(tmp_path)).key
+    assert celular.CompiledCache(config, path=str(tmp_path)).key == key
+
+    monkeypatch.setattr(celular, 'source_digest', lambda: 'edited')
+    edited = celular.CompiledCache(config, path=str(tmp_path)).key
+    assert edited != key
+
+    monkeypatch.setattr(lark, '__version__', lark.__version__ + '.post1')
+    assert celular.CompiledCache(config, path=str(tmp_path)).key not in (key, edited)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_compiled_cache_misses_after_source_change(make_config, tmp_path, monkeypatch):
+    config = make_config(["procs.exists(p, p['name'] == 'sshd')"])
+    cache = celular.CompiledCache(config, path=str(tmp_path))
+    cache.save({}, {})
+    assert cache.load() is not None
+
+    monkeypatch.setattr(celular, 'source_digest', lambda: 'edited')
+    assert celular.CompiledCache(config, path=str(tmp_path)).load() is None
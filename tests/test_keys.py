@@ -0,0 +1,21 @@
+import celular
+from conftest import evaluate, load_expressions, procs_table, recorded_tables
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_keys_pruned_to_the_ones_read(make_config):
+    config = make_config(["procs.exists(p, p['ppid'] == 0 || p['name'] == 'sshd')"])
+    source = load_expressions(config)._uses[celular.Processes.usename]
+    assert source.keys == ['name', 'ppid']
+    assert source._process_iter_attrs == ['name', 'ppid']
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_unprunable_use_keeps_keys_read_by_name(make_config):
+    # the map() result is indexed by exists(), so procs keeps its default keys, plus ppid read by the other expression
+    config = make_config(["procs.exists(p, !(p['username'] == 'svc') || p['ppid'] == 0)",
+                          "procs.map(p, p['name']).exists(n, n == 'sshd')"])
+    source = load_expressions(config)._uses[celular.Processes.usename]
+    assert 'ppid' in source.keys and set(celular.Processes().keys) <= set(source.keys)
+    tables = recorded_tables(procs_table(20, {1: {'ppid': 0}}))
+    assert evaluate(config, tables, native_functions=False, streaming=False) == [True, False]
@@ -0,0 +1,35 @@
+import celular
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def processes(monkeypatch, n, workers, fetched=None):
+    source = celular.Processes()
+    source.keys = source._process_iter_attrs = ['pid', 'name']
+    source.workers = workers
+
+    def fetch_infos(pids):
+        if fetched is not None:
+            fetched.extend(pids)
+        # every 7th PID vanished before it was read
+        return [{'pid': pid, 'name': f'p{pid}'} for pid in pids if pid % 7]
+
+    monkeypatch.setattr(celular.psutil, 'pids', lambda: list(range(n, 0, -1)))
+    monkeypatch.setattr(source, '_fetch_infos', fetch_infos)
+    return source
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_parallel_infos_in_pid_order(monkeypatch):
+    records = list(processes(monkeypatch, 1000, workers=4))
+    assert records == [{'pid': pid, 'name': f'p{pid}'} for pid in range(1, 1001) if pid % 7]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_parallel_infos_stop_early(monkeypatch):
+    fetched = []
+    source = processes(monkeypatch, 10000, workers=2, fetched=fetched)
+    scan = iter(source)
+    assert next(scan)['pid'] == 1
+    scan.close()
+    # at most the window in flight when the scan stopped, never the whole table
+    assert len(fetched) <= (2 * 2 + 1) * celular.Processes.chunk_max
@@ -0,0 +1,97 @@
+import os
+
+import psutil
+import pytest
+
+import celular
+
+pytestmark = pytest.mark.skipif(not celular.ProcFSCollector.available(), reason='needs Linux /proc')
+
+BOOT_TIME = 1700000000.0
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class FakeUserDB(object):
+    def __init__(self, names):
+        self.names = names
+
+    def records(self):
+        return [{'pw_name': n, 'pw_uid': u} for u, n in self.names.items()]
+
+    def name(self, uid):
+        return self.names.get(uid)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def add_process(root, pid, comm, state='S', ppid=1, starttime=100, uid=0, exe=None, cwd=None, cmdline=None):
+    path = root / str(pid)
+    path.mkdir()
+    # state ppid, 17 unread fields, starttime (field 22 of proc(5))
+    (path / 'stat').write_bytes(f'{pid} ({comm}) {state} {ppid} {"0 " * 17}{starttime} 0 0\n'.encode())
+    (path / 'status').write_text(f'Name:\t{comm[:15]}\nUid:\t{uid}\t{uid}\t{uid}\t{uid}\n')
+    if cmdline is not None:
+        (path / 'cmdline').write_bytes(cmdline)
+    if exe is not None:
+        os.symlink(exe, path / 'exe')
+    if cwd is not None:
+        os.symlink(cwd, path / 'cwd')
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+@pytest.fixture
+def fake_proc(tmp_path, monkeypatch):
+    root = tmp_path / 'proc'
+    root.mkdir()
+    (root / 'self').mkdir()
+    (root / 'stat').write_text('cpu 0 0 0 0\n')
+    add_process(root, 1, 'systemd', ppid=0, exe='/usr/lib/systemd/systemd', cwd='/')
+    add_process(root, 2, 'kthreadd', ppid=0)
+    add_process(root, 40, 'sshd: (a) b)', ppid=1, starttime=250, exe='/usr/sbin/sshd', cwd='/', uid=1000)
+    add_process(root, 41, 'very-long-daemo', starttime=300, exe='/opt/x/bin/very-long-daemon (deleted)', cwd='/tmp',
+                cmdline=b'/opt/x/bin/very-long-daemon\x00--flag\x00', uid=4242)
+    add_process(root, 42, 'defunct', state='Z', ppid=40)
+    monkeypatch.setattr(celular.ProcFSCollector, 'procfs', str(root))
+    monkeypatch.setattr(celular.psutil, 'boot_time', lambda: BOOT_TIME)
+    return root
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_procfs_recorded_table(fake_proc):
+    collector = celular.ProcFSCollector(celular.ProcFSCollector.fields, FakeUserDB({0: 'root', 1000: 'alice'}))
+    ticks = os.sysconf('SC_CLK_TCK')
+    assert collector.pids() == [1, 2, 40, 41, 42]
+    # 43 vanished between the scan and the read
+    infos = {d['pid']: d for d in collector.infos([1, 2, 40, 41, 42, 43])}
+    assert sorted(infos) == [1, 2, 40, 41, 42]
+    assert infos[1] == {'pid': 1, 'name': 'systemd', 'exe': '/usr/lib/systemd/systemd', 'cwd': '/',
+                        'username': 'root', 'create_time': 100 / ticks + BOOT_TIME, 'ppid': 0}
+    # kernel threads have empty links
+    assert (infos[2]['exe'], infos[2]['cwd']) == ('', '')
+    assert infos[40]['name'] == 'sshd: (a) b)'
+    assert infos[40]['username'] == 'alice'
+    # truncated comm extended from argv[0], ' (deleted)' dropped, unknown uid as the number
+    assert infos[41]['name'] == 'very-long-daemon'
+    assert infos[41]['exe'] == '/opt/x/bin/very-long-daemon'
+    assert infos[41]['username'] == '4242'
+    # zombies read as access-denied
+    assert (infos[42]['exe'], infos[42]['cwd'], infos[42]['ppid']) == (None, None, 40)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_procfs_matches_psutil():
+    # this process and its parent exist for the whole test
+    pids = [os.getpid(), os.getppid()]
+    collector = celular.ProcFSCollector(celular.ProcFSCollector.fields)
+    by_procfs = {d['pid']: d for d in collector.infos(pids)}
+    for pid in pids:
+        expected = psutil.Process(pid).as_dict(list(celular.ProcFSCollector.fields), ad_value=None)
+        assert by_procfs[pid] == expected
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_procfs_fetches_other_fields_from_psutil():
+    collector = celular.ProcFSCollector(['pid', 'name', 'cmdline', 'uids'])
+    assert collector.fallback == ['cmdline', 'uids']
+    info = collector.info(os.getpid())
+    expected = psutil.Process().as_dict(['cmdline', 'uids'])
+    assert (info['cmdline'], info['uids']) == (expected['cmdline'], expected['uids'])
@@ -0,0 +1,94 @@
+import json
+import struct
+
+import pytest
+
+import celular
+from conftest import procs_table
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def write(tmp_path, sources):
+    path = str(tmp_path / f'test{celular.SnapshotFile.suffix}')
+    celular.SnapshotFile.write(path, sources)
+    return path
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_snapshot_round_trip(tmp_path):
+    procs = procs_table(20, {3: {'name': None, 'create_time': None}, 5: {'cmdline': ['a', 'b']}})
+    path = write(tmp_path, {'processes': procs, 'common_users': ['alice', 'bob']})
+    snapshot = celular.SnapshotFile(path)
+    assert snapshot.uses() == ['processes', 'common_users']
+    keys = list(dict.fromkeys(k for r in procs for k in r))
+    assert list(snapshot.records('processes')) == [{k: r.get(k) for k in keys} for r in procs]
+    assert list(snapshot.records('common_users')) == ['alice', 'bob']
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_snapshot_is_little_endian(tmp_path):
+    path = write(tmp_path, {'processes': procs_table(3)})
+    with open(path, 'rb') as f:
+        raw = f.read()
+    start = len(celular.SnapshotFile.magic) + 4
+    length = struct.unpack_from('<I', raw, len(celular.SnapshotFile.magic))[0]
+    header = json.loads(raw[start:start + length])
+    assert header['byteorder'] == 'little'
+    data = start + length + (-(start + length) % 8)
+    pids = header['sources']['processes']['columns']['pid']
+    assert pids['type'] == 'int'
+    assert struct.unpack_from('<3q', raw, data + pids['values']) == (1, 2, 3)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_snapshot_rejects_other_byte_orders(tmp_path):
+    path = write(tmp_path, {'processes': procs_table(3)})
+    with open(path, 'rb') as f:
+        raw = f.read()
+    start = len(celular.SnapshotFile.magic) + 4
+    length = struct.unpack_from('<I', raw, len(celular.SnapshotFile.magic))[0]
+    header = json.loads(raw[start:start + length])
+    header['byteorder'] = 'big'
+    # same padded length, so the data section does not move
+    _header = json.dumps(header).encode().ljust(length)
+    with open(path, 'wb') as f:
+        f.write(raw[:len(celular.SnapshotFile.magic)] + struct.pack('<I', length) + _header + raw[start + length:])
+    with pytest.raises(ValueError, match='byte order'):
+        celular.SnapshotFile(path)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_snapshot_round_trip_undecodable_paths(tmp_path):
+    # os.fsdecode(b'/home/caf\xe9') on a UTF-8 system, as psutil reports such a cwd
+    procs = procs_table(3, {2: {'cwd': '/home/caf\udce9', 'exe': '/opt/\udcff\udcfe/bin'}})
+    path = write(tmp_path, {'processes': procs})
+    records = list(celular.SnapshotFile(path).records('processes'))
+    assert records == procs
+    assert records[1]['cwd'].encode('utf-8', 'surrogateescape') == b'/home/caf\xe9'
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def dumped_uses(capsys, argv):
+    assert celular.main(argv) == 0
+    return set(json.loads(line)['use'] for line in capsys.readouterr().out.splitlines())
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_json_output_leaves_out_opt_in_sources(monkeypatch, capsys):
+    scanned = []
+    for source in (celular.Connections, celular.Sessions):
+        monkeypatch.setattr(source, '__iter__', lambda self: scanned.append(self.usename) or iter([{'pid': 1}]))
+    uses = dumped_uses(capsys, ['--json-output', '--json-output-format=ndjson'])
+    assert uses == {'processes', 'mounts', 'users', 'common_users'} and scanned == []
+    assert dumped_uses(capsys, ['--json-output=sessions', '--json-output-format=ndjson']) == {'sessions'}
+    uses = dumped_uses(capsys, ['--json-output', '--json-output-all', '--json-output-format=ndjson'])
+    assert {'connections', 'sessions'} <= uses
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_json_output_rejects_unknown_fields(capsys):
+    assert celular.main(['--json-output', '--json-output-format=ndjson', '--json-output-fields=pid,nmae']) == -1
+    captured = capsys.readouterr()
+    assert captured.out == '' and "Unknown field: 'nmae'" in captured.err
+    assert dumped_uses(capsys, ['--json-output=mounts', '--json-output-format=ndjson',
+                                '--json-output-fields=mountpoint,fstype']) == {'mounts'}
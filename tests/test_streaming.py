@@ -0,0 +1,72 @@
+import celular
+from conftest import SHIPPED_CONFIGS, evaluate, load_expressions, procs_table, recorded_tables
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_stream_stops_at_first_hit(make_config):
+    config = make_config(["procs.exists(p, p['name'] == 'sshd')"])
+    tables = recorded_tables(procs_table(300, {7: {'name': 'sshd'}}))
+    assert evaluate(config, tables, until_one=True, streaming_chunk=16) is True
+    assert evaluate(config, tables, until_one=True, streaming=False) is True
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_stream_without_hit_keeps_the_scan(make_config):
+    config = make_config(["procs.exists(p, p['name'] == 'sshd')", "procs.exists(p, p['pid'] == 299)"])
+    tables = recorded_tables(procs_table(300))
+    assert evaluate(config, tables, until_one=True, streaming_chunk=16) is True
+    assert evaluate(config, tables, streaming_chunk=16) == [False, True]
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_stream_skips_predicates_reading_their_own_source(make_config):
+    # the parent (pid 3) is in the first chunk, the child in the last one: a per-chunk evaluation never sees both
+    for expr in ("procs.filter(p, procs.exists(q, q['ppid'] == p['pid'] && q['name'] == 'sshd')) != []",
+                 "procs.exists(p, procs.exists(q, q['ppid'] == p['pid'] && q['name'] == 'sshd'))"):
+        config = make_config([expr])
+        tables = recorded_tables(procs_table(40, {38: {'name': 'sshd', 'ppid': 3}}))
+        assert load_expressions(config)._expressions[0]['stream'] is None
+        assert evaluate(config, tables) == [True]
+        assert evaluate(config, tables, until_one=True, streaming_chunk=4) is True
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_stream_skips_outer_lists_reading_their_own_source(make_config):
+    expr = "procs.map(q, q['name']).exists(n, procs.exists(p, p['name'] == n && p['pid'] == 1))"
+    config = make_config([expr])
+    tables = recorded_tables(procs_table(40))
+    assert evaluate(config, tables) == [True]
+    assert evaluate(config, tables, until_one=True, streaming_chunk=4) is True
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_stream_error_without_hit_raises_as_celpy(make_config):
+    config = make_config(["procs.exists(p, p['name'].startsWith('zz'))"])
+    tables = recorded_tables(procs_table(40, {20: {'name': None}}))
+    assert evaluate(config, tables, until_one=True, streaming_chunk=4) == 'CELEvalError'
+    assert evaluate(config, tables, until_one=True, streaming=False) == 'CELEvalError'
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_stream_filter_forms_keep_the_verdict(make_config):
+    # celpy's filter() fails on a record the predicate fails on, even after a match in an earlier chunk: streamed, the
+    # match is reported instead, and both mean in use
+    exprs = ["procs.filter(p, p['name'] == 'sshd' || (p['pid'] == 39 && p['cwd'] == 1)) != []",
+             "procs.exists(p, p['name'] == 'sshd' || (p['pid'] == 39 && p['cwd'] == 1))"]
+    config = make_config(exprs)
+    assert [x['stream'] for x in load_expressions(config)._expressions.values()] == ['processes', 'processes']
+    tables = recorded_tables(procs_table(40, {2: {'name': 'sshd'}, 39: {'name': 'x', 'cwd': 'x'}}))
+    config = make_config(exprs[:1])
+    assert evaluate(config, tables, until_one=True, streaming_chunk=4) is True
+    assert evaluate(config, tables, until_one=True, streaming=False) == 'CELEvalError'
+    config = make_config(exprs[1:])
+    assert evaluate(config, tables, until_one=True, streaming_chunk=4) is True
+    assert evaluate(config, tables, until_one=True, streaming=False) is True
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_stream_shipped_config():
+    config = celular.Config(SHIPPED_CONFIGS[0])
+    expressions = celular.Expressions(celular.LazyEnvironment(), config.expressions, bindings=config.bindings,
+                                      options=dict(config.options, users_cache=False))
+    assert [x['stream'] for x in expressions._expressions.values()] == ['processes', 'processes', 'mounts']
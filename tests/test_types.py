@@ -0,0 +1,57 @@
+import celpy
+
+import celular
+from conftest import evaluate, recorded_tables
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def cel(expr, activation):
+    env = celpy.Environment()
+    return env.program(env.compile(expr)).evaluate(activation)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_indexed_list_type_compares_as_list():
+    assert celular.IndexedList == celpy.celtypes.ListType
+    assert not celular.IndexedList != celpy.celtypes.ListType
+    assert celular.IndexedList != celpy.celtypes.MapType
+    assert not celular.IndexedList == celpy.celtypes.MapType
+    assert celular.IndexedList == celular.IndexedList
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_indexed_list_type_in_cel():
+    values = {'l': celular.IndexedList([celpy.celtypes.StringType('/')])}
+    assert cel('type(l) == list', values) == True
+    assert cel('type(l) != list', values) == False
+    assert cel('type(l) != map', values) == True
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_indexed_vars_type_in_expressions(make_config):
+    config = make_config([
+        {'uses': ['mounts'], 'expr': "type(vars.mount_points) != list || mounts.exists(m, m['mountpoint'] == '/')"},
+        {'uses': ['mounts'], 'expr': "type(vars.mount_points) == list"},
+        {'uses': ['mounts'], 'expr': "type(vars.mount_points) != list"},
+    ], vars={'mount_points': ['/', '/boot']})
+    assert isinstance(config.cel_env_objects['vars']['mount_points'], celular.IndexedList)
+    assert evaluate(config, recorded_tables()) == [True, True, False]
+    assert evaluate(config, recorded_tables(), until_one=True) is True
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_lazy_record_type_compares_as_map():
+    assert celular.LazyRecord == celpy.celtypes.MapType
+    assert not celular.LazyRecord != celpy.celtypes.MapType
+    assert celular.LazyRecord != celpy.celtypes.ListType
+    assert not celular.LazyRecord == celpy.celtypes.ListType
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_lazy_record_type_in_cel():
+    resolved = []
+    proc = celular.LazyRecord(['pid', 'name'], lambda k: resolved.append(k) or {'pid': 1, 'name': 'init'}[k])
+    assert cel('type(proc) == map', {'proc': proc}) == True
+    assert cel('type(proc) != map', {'proc': proc}) == False
+    assert cel("type(proc) != map || proc['name'] == 'init'", {'proc': proc}) == True
+    assert resolved == ['name']
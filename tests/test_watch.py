@@ -0,0 +1,51 @@
+import errno
+import logging
+import struct
+import types
+
+import pytest
+
+import celular
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+class FakeConnector(object):
+    # replays recv() outcomes: bytes are returned, exceptions raised
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+
+    def recv(self, size):
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def proc_event(what):
+    return b'\0' * 36 + struct.pack('=I', what)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def drain(sock):
+    watcher = types.SimpleNamespace(logger=logging.getLogger('test'), proc_events=celular.Watcher.proc_events)
+    return celular.Watcher._drain_proc_connector(watcher, sock)
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_drain_reports_proc_events():
+    assert drain(FakeConnector(proc_event(0), BlockingIOError())) is False
+    assert drain(FakeConnector(proc_event(0), proc_event(celular.Watcher.proc_events), BlockingIOError())) is True
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_drain_treats_overrun_as_change():
+    sock = FakeConnector(OSError(errno.ENOBUFS, 'No buffer space available'), proc_event(0), BlockingIOError())
+    assert drain(sock) is True
+    assert sock.outcomes == []
+
+
+# ----------------------------------------------------------------------------------------------------------------------
+def test_drain_raises_other_errors():
+    with pytest.raises(OSError):
+        drain(FakeConnector(OSError(errno.EBADF, 'Bad file descriptor')))